@@ -26,18 +26,13 @@ class FlipbookPanelApp(Application):
         """
         Called as the application is being initialized
         """
-        # We won't be able to do anything if there's no UI. The import
-        # of our app module below required some Qt components, and will likely
-        # blow up.
+        # We won't be able to do anything if there's no UI. The app module
+        # needs some Qt components, it is imported with the special
+        # import_module command once the panel is created so the engine
+        # starts without it and toolkit's code reload mechanism still works.
         if not self.engine.has_ui:
             return
 
-        # first, we use the special import_module command to access the app module
-        # that resides inside the python folder in the app. This is where the actual UI
-        # and business logic of the app is kept. By using the import_module command,
-        # toolkit's code reload mechanism will work properly.
-        app_payload = self.import_module("app")
-
         # now register a panel, this is to tell the engine about the our panel ui 
         # that the engine can automatically create the panel - this happens for
         # example when a saved window layout is restored in Nuke or at startup.
@@ -91,14 +86,8 @@ class FlipbookPanelApp(Application):
         # for the panel widget in the future. In that case, we'll need to
         # check here to see if the panel has been pinned by the user, and
         # if it has NOT navigate it to home.
-        self._app.log_error('Navigated to app!')
-        self._app.log_error('Panel object {}'.format(self._current_panel))
-
-
         if self.engine.has_ui and self._current_panel:
             try:
-                self._app.log_error('In app try!')
-
                 self._current_panel.navigate_to_context(new_context)
             except RuntimeError:
                 self.log_debug(
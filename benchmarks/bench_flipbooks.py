@@ -0,0 +1,941 @@
+"""
+Benchmarks of the scan, refresh, metadata and thumbnail code of the app.
+
+Synthetic flipbook trees are generated in a temporary directory and the
+headless modules of the app are run against them, with stand-ins for hou,
+sgtk and the toolkit templates. Every benchmark reports its wall time, the
+file system calls it made and its peak memory. Publishes run against a
+local ShotGrid stand-in that counts the requests made to it, chunked
+uploads against a local HTTP stand-in of the cloud storage.
+
+    python benchmarks/bench_flipbooks.py
+    python benchmarks/bench_flipbooks.py --case 1000x10000 --repeat 1
+    python benchmarks/bench_flipbooks.py --save --check
+    python benchmarks/bench_flipbooks.py --publish 20 --latency 0.2
+
+--save appends the results to benchmarks/history.jsonl, --check compares
+them to the last saved results and exits with 1 on a regression. The file
+system calls and requests are also compared to benchmarks/baseline.json,
+which holds the counts of the default run and doesn't depend on the
+machine. --write-baseline replaces it with the counts of this run.
+--check also fails when a check of the requests and errors of the
+publish queue against the mock ShotGrid fails, or when a failed upload
+isn't resumed against the local storage.
+"""
+import os
+import re
+import sys
+import json
+import time
+import types
+import random
+import hashlib
+import http.server
+import urllib.request
+import threading
+import multiprocessing
+import itertools
+import shutil
+import base64
+import argparse
+import platform
+import tempfile
+import importlib
+import tracemalloc
+from contextlib import contextmanager
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'python', 'app')
+HISTORY_PATH = os.path.join(BENCH_DIR, 'history.jsonl')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+# (versions, frames per version)
+DEFAULT_CASES = ['10x100', '100x1000', '1000x100']
+
+# share of the versions that have missing frames
+MISSING_RATIO = 0.2
+
+HIP_NAME = 'shot010_fx'
+
+###################################################################################################
+# Stand-ins
+
+def install_stand_ins():
+    """
+    Registers stand-ins for the host modules and loads the app package
+    without running its __init__, which imports the Qt dialog.
+    """
+    qt_core = types.ModuleType('QtCore')
+    qt_core.QObject = type('QObject', (object,), {'__init__': lambda self, parent=None: None})
+    qt_core.Signal = Signal
+
+    qt = types.ModuleType('sgtk.platform.qt')
+    qt.QtCore = qt_core
+    qt.QtGui = types.ModuleType('QtGui')
+
+    sgtk = types.ModuleType('sgtk')
+    sgtk.platform = types.ModuleType('sgtk.platform')
+    sgtk.platform.qt = qt
+    sgtk.util = types.SimpleNamespace(register_publish=register_publish)
+    sys.modules.setdefault('sgtk', sgtk)
+    sys.modules.setdefault('sgtk.platform', sgtk.platform)
+    sys.modules.setdefault('sgtk.platform.qt', qt)
+
+    hou = types.ModuleType('hou')
+    hou.hipFile = types.SimpleNamespace(basename=lambda: HIP_NAME + '.hip', path=lambda: HIP_NAME + '.hip')
+    sys.modules.setdefault('hou', hou)
+
+    package = types.ModuleType('flipbook_app')
+    package.__path__ = [APP_DIR]
+    sys.modules['flipbook_app'] = package
+
+    modules = {}
+    for name in ('catalog', 'encoder', 'jsonmanager', 'publisher', 'scanner', 'thumbstore', 'treeitem', 'uploader'):
+        modules[name] = importlib.import_module('flipbook_app.' + name)
+    return types.SimpleNamespace(**modules)
+
+class Signal():
+    """
+    Stand-in of QtCore.Signal, slots are called right away on the thread
+    that emits.
+    """
+    def __init__(self, *types):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+def register_publish(tk, context, path, name, **kwargs):
+    # the toolkit call does a few requests, one is enough to count them
+    return tk.shotgun.create('PublishedFile', {'code': name, 'path': path})
+
+class OutputTemplate():
+    """
+    Stand-in of the output_flipbook_template,
+    <root>/<name>_<node>_v<version>/<name>_<node>_v<version>.$F4.jpg
+    """
+    PATH_RE = re.compile(r'^(?P<name>%s)_(?P<node>\w+?)_v(?P<version>\d+)\.\$F4\.jpg$' % HIP_NAME)
+
+    def __init__(self, root_path, level=0):
+        self._root_path = root_path
+        self._level = level
+
+    @property
+    def parent(self):
+        return OutputTemplate(self._root_path, self._level + 1)
+
+    def apply_fields(self, fields):
+        if self._level == 2:
+            return self._root_path
+
+        name = '%s_%s_v%03d' % (fields['name'], fields['node'], fields['version'])
+        if self._level == 1:
+            return os.path.join(self._root_path, name)
+        return os.path.join(self._root_path, name, name + '.$F4.jpg')
+
+    def validate(self, path):
+        return bool(self.get_fields(path))
+
+    def get_fields(self, path):
+        match = self.PATH_RE.match(os.path.basename(path))
+        if not match:
+            return {}
+
+        fields = match.groupdict()
+        fields['version'] = int(fields['version'])
+        fields['SEQ'] = 'FORMAT: $F'
+        return fields
+
+class App():
+    def __init__(self):
+        self.context = types.SimpleNamespace(as_template_fields=lambda template: {})
+        self.errors = []
+
+    def log_error(self, msg):
+        self.errors.append(msg)
+
+class Scheduler():
+    def __init__(self):
+        self.requests = 0
+
+    def request(self, job, priority=None):
+        self.requests += 1
+
+class Panel():
+    """
+    Stand-in of the AppDialog methods used by the tree items.
+    """
+    def __init__(self, json_manager, thumb_store):
+        self._app = App()
+        self._json_manager = json_manager
+        self._thumb_store = thumb_store
+        self._scheduler = Scheduler()
+
+    def get_thumbnail_store(self):
+        return self._thumb_store
+
+    def get_thumbnail_scheduler(self):
+        return self._scheduler
+
+    def write_item_data(self, item):
+        fields = item.get_fields()
+        self._json_manager.write_item_data(fields['json_name'], fields['data'])
+
+    def item_changed(self, item, thumbnail=False):
+        pass
+
+class StorageHandler(http.server.BaseHTTPRequestHandler):
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+
+        # drop every fail_every-th part to exercise the retries
+        storage = self.server.storage
+        with storage.lock:
+            storage.parts += 1
+            fail = storage.fail_every and storage.parts % storage.fail_every == 0
+        if fail:
+            self.close_connection = True
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', '"%s"' % hashlib.md5(data).hexdigest())
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class LocalStorage():
+    """
+    Local HTTP stand-in of the cloud storage of a site, the parts of
+    chunked uploads are sent to it.
+    """
+    def __init__(self, fail_every=0):
+        self.fail_every = fail_every
+        self.parts = 0
+        self.lock = threading.Lock()
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StorageHandler)
+        self._server.storage = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d/%s' % (self._server.server_address[1], path)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class MockShotgun():
+    """
+    Local ShotGrid stand-in that counts the requests made to it, every
+    request taking latency seconds. With a storage, it also has the private
+    methods of shotgun_api3 used by chunked uploads.
+
+    Creating or updating a Version whose code is in fail_codes fails, and
+    so does a batch holding such a request, as a ShotGrid batch fails as a
+    whole. The ids of the Versions created and the part numbers asked for
+    are kept for the checks.
+    """
+    def __init__(self, latency, storage=None):
+        self._latency = latency
+        self._storage = storage
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.requests = {}
+        self.fail_codes = set()
+        self.created_versions = []
+        self.part_numbers = []
+
+        self.server_info = {'s3_direct_uploads_enabled': storage is not None}
+        self.config = types.SimpleNamespace(scheme='http', server='localhost')
+
+    def _request(self, name):
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+        time.sleep(self._latency)
+
+    def _check_data(self, entity_type, data):
+        if entity_type == 'Version' and data.get('code') in self.fail_codes:
+            raise Exception("Could not save version %s" % data['code'])
+
+    def _new_id(self, entity_type):
+        entity_id = next(self._ids)
+        if entity_type == 'Version':
+            self.created_versions.append(entity_id)
+        return entity_id
+
+    def create(self, entity_type, data):
+        self._request('create')
+        self._check_data(entity_type, data)
+        return {'type': entity_type, 'id': self._new_id(entity_type)}
+
+    def update(self, entity_type, entity_id, data):
+        self._request('update')
+        self._check_data(entity_type, data)
+        return {'type': entity_type, 'id': entity_id}
+
+    def batch(self, requests):
+        self._request('batch')
+        for request in requests:
+            self._check_data(request['entity_type'], request['data'])
+        return [{'type': request['entity_type'], 'id': request.get('entity_id') or self._new_id(request['entity_type'])}
+                for request in requests]
+
+    def upload(self, entity_type, entity_id, path, field_name=None):
+        self._request('upload')
+        return next(self._ids)
+
+    def _get_attachment_upload_info(self, is_thumbnail, filename, is_multipart_upload):
+        self._request('upload_info')
+        return {'upload_info': {'upload_id': next(self._ids), 'filename': filename}}
+
+    def _get_upload_part_link(self, upload_info, filename, part_number):
+        self._request('part_link')
+        self.part_numbers.append(part_number)
+        return self._storage.url('%s/%s' % (upload_info['upload_info']['upload_id'], part_number))
+
+    def _upload_data_to_storage(self, data, content_type, size, storage_url):
+        request = urllib.request.Request(storage_url, data=data, method='PUT')
+        request.add_header('Content-Type', content_type)
+        response = urllib.request.urlopen(request)
+        return response.headers['ETag']
+
+    def _complete_multipart_upload(self, upload_info, filename, etags):
+        self._request('complete')
+
+    def _auth_params(self):
+        return {}
+
+    def _send_form(self, url, params):
+        self._request('link')
+        return '1:%d\n' % next(self._ids)
+
+class Nozmov():
+    """
+    Stand-in of the tk-multi-nozmov app, encoding takes encode_time seconds
+    and writes a movie of movie_size bytes.
+    """
+    def __init__(self, movie_dir, encode_time, movie_size):
+        self._movie_dir = movie_dir
+        self._encode_time = encode_time
+        self._movie_size = movie_size
+        self._out_file = None
+
+    def calc_output_filepath(self, path, preset):
+        return os.path.join(self._movie_dir, os.path.basename(path).replace('####', 'preview') + '.mov')
+
+    def noz_movie(self, out_file=None, **kwargs):
+        self._out_file = out_file
+
+    def execute(self):
+        time.sleep(self._encode_time)
+        with open(self._out_file, 'wb') as movie:
+            movie.write(b'\0' * self._movie_size)
+
+class PublishApp(App):
+    def __init__(self, movie_dir, latency, encode_time, movie_size=1024):
+        super(PublishApp, self).__init__()
+        self.shotgun = MockShotgun(latency)
+        self.sgtk = types.SimpleNamespace(shotgun=self.shotgun)
+        self.engine = types.SimpleNamespace(apps={'tk-multi-nozmov': Nozmov(movie_dir, encode_time, movie_size)})
+        self.context = types.SimpleNamespace(as_template_fields=lambda template: {}, entity={'name': 'shot010'},
+                                             step={'name': 'fx'}, task=None, project=None, user={'name': 'artist'})
+
+    def log_debug(self, msg):
+        pass
+
+    def log_warning(self, msg):
+        pass
+
+###################################################################################################
+# Measuring
+
+class CountedEntry():
+    """
+    Wraps an os.DirEntry to count its stat() calls, which don't go through
+    the os module.
+    """
+    def __init__(self, entry, count):
+        self._entry = entry
+        self._count = count
+        self.name = entry.name
+        self.path = entry.path
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def stat(self, *args, **kwargs):
+        self._count('entry_stat')
+        return self._entry.stat(*args, **kwargs)
+
+class CountedScandir():
+    """
+    Wraps a scandir iterator to hand out CountedEntry objects.
+    """
+    def __init__(self, iterator, count):
+        self._iterator = iterator
+        self._count = count
+
+    def __iter__(self):
+        return (CountedEntry(entry, self._count) for entry in self._iterator)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if hasattr(self._iterator, 'close'):
+            self._iterator.close()
+
+class SyscallCounter():
+    """
+    Counts the file system calls made while it is active by wrapping the
+    os functions, and the module level copies the app made of them. The
+    stat() calls of the entries returned by scandir are counted as well.
+    """
+    NAMES = ('scandir', 'listdir', 'stat', 'lstat', 'open', 'rename', 'replace', 'remove', 'makedirs', 'mkdir')
+
+    def __init__(self, modules):
+        self._modules = modules
+        self.counts = {}
+
+    def _count(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _wrap(self, name, function):
+        def wrapper(*args, **kwargs):
+            self._count(name)
+            if name == 'scandir':
+                return CountedScandir(function(*args, **kwargs), self._count)
+            return function(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def active(self):
+        import builtins
+
+        patched = []
+        targets = [(os, name) for name in self.NAMES if hasattr(os, name)]
+        targets.append((builtins, 'open'))
+        for module in self._modules:
+            targets.extend((module, name) for name in self.NAMES if name != 'open' and callable(getattr(module, name, None)))
+
+        for module, name in targets:
+            original = getattr(module, name)
+            patched.append((module, name, original))
+            setattr(module, name, self._wrap(name, original))
+        try:
+            yield self
+        finally:
+            for module, name, original in reversed(patched):
+                setattr(module, name, original)
+
+def measure(function, modules, repeat):
+    """
+    Returns the fastest wall time of repeat runs along with the file system
+    calls and the peak memory of the first run.
+    """
+    counter = SyscallCounter(modules)
+    tracemalloc.start()
+    with counter.active():
+        function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times = []
+    for index in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return {
+        'wall': min(times),
+        'syscalls': sum(counter.counts.values()),
+        'syscalls_by_name': counter.counts,
+        'peak_memory': peak
+        }
+
+###################################################################################################
+# Synthetic trees
+
+def parse_case(case):
+    versions, frames = case.lower().split('x')
+    return int(versions), int(frames)
+
+def generate_tree(root_path, versions, frames, seed=0):
+    """
+    Creates versions version directories of empty frames spread over a
+    few flipbook names, a share of them with missing frames.
+    """
+    rng = random.Random(seed)
+    template = OutputTemplate(root_path)
+
+    for index in range(versions):
+        fields = {'name': HIP_NAME, 'node': 'flip%d' % (index % 10), 'version': int(index / 10) + 1}
+        path = template.apply_fields(fields)
+        dir_path = os.path.dirname(path)
+        os.makedirs(dir_path)
+
+        frame_numbers = range(1001, 1001 + frames)
+        if frames > 2 and rng.random() < MISSING_RATIO:
+            gap = rng.randint(1, max(1, int(frames / 10)))
+            start = rng.randint(1002, 1000 + frames - gap)
+            frame_numbers = [frame for frame in frame_numbers if not start <= frame < start + gap]
+
+        head, tail = os.path.basename(path).split('$F4')
+        for frame in frame_numbers:
+            open(os.path.join(dir_path, '%s%04d%s' % (head, frame, tail)), 'w').close()
+
+###################################################################################################
+# Benchmarks
+
+def make_parser(template):
+    def parse_path(path):
+        if template.validate(path):
+            return template.get_fields(path)
+        return None
+    return parse_path
+
+def bench_case(app, root_path, repeat):
+    template = OutputTemplate(root_path)
+    parse_path = make_parser(template)
+    counted = [app.scanner, app.jsonmanager, app.thumbstore, app.treeitem]
+    results = {}
+
+    # scan without the scan cache, listing only like the watcher and
+    # counting sizes like the refresh, then with the cache of a refresh
+    results['scan_cold'] = measure(lambda: app.scanner.scan_flipbooks(root_path, parse_path), counted, repeat)
+    results['scan_sizes'] = measure(lambda: app.scanner.scan_flipbooks(root_path, parse_path, count_sizes=True), counted, repeat)
+
+    scan_data = {}
+    for version in app.scanner.scan_flipbooks(root_path, parse_path, count_sizes=True):
+        data = {}
+        version.apply(data)
+        scan_data[os.path.basename(version.path).split('.')[0]] = data
+
+    cache = dict((os.path.dirname(data['scan']['path']), app.scanner.ScanVersion.from_cache(None, data))
+                 for data in scan_data.values())
+    results['scan_cached'] = measure(lambda: app.scanner.scan_flipbooks(root_path, parse_path, cache, count_sizes=True), counted, repeat)
+
+    # metadata writes into a new directory per run, batched like a refresh
+    # and one by one like the ui
+    work_dir = root_path + '_work'
+
+    def write_metadata(batched):
+        json_manager = app.jsonmanager.JsonManager(App(), OutputTemplate(tempfile.mkdtemp(dir=work_dir)), HIP_NAME)
+        if batched:
+            with json_manager.batch():
+                for name, data in scan_data.items():
+                    json_manager.write_item_data(name, data)
+        else:
+            for name, data in scan_data.items():
+                json_manager.write_item_data(name, data)
+        json_manager.wait_for_compaction()
+        return json_manager
+
+    metadata_dir = write_metadata(True).get_root_path()
+
+    results['metadata_batch_write'] = measure(lambda: write_metadata(True), counted, repeat)
+    results['metadata_single_write'] = measure(lambda: write_metadata(False), counted, repeat)
+    results['metadata_load'] = measure(
+        lambda: app.jsonmanager.JsonManager(App(), OutputTemplate(metadata_dir), HIP_NAME), counted, repeat)
+
+    # tree items restored from the metadata and refreshed from the disk
+    json_manager = app.jsonmanager.JsonManager(App(), OutputTemplate(metadata_dir), HIP_NAME)
+    store = app.thumbstore.ThumbnailStore(metadata_dir, HIP_NAME)
+    panel = Panel(json_manager, store)
+    versions = app.scanner.scan_flipbooks(root_path, parse_path)
+
+    def make_items():
+        items = []
+        with json_manager.batch():
+            for version in versions:
+                fields = dict(version.fields)
+                fields['json_name'] = os.path.basename(version.path).split('.')[0]
+                fields['data'] = json_manager.get_item_data(fields['json_name'])
+                items.append(app.treeitem.TreeItem(version.path, fields, panel))
+        return items
+
+    items = make_items()
+
+    def refresh_items():
+        with json_manager.batch():
+            for item in items:
+                item.refresh()
+                panel.write_item_data(item)
+
+    results['items_restore'] = measure(make_items, counted, repeat)
+    results['items_set_range'] = measure(refresh_items, counted, repeat)
+
+    # thumbnails, migrating inline thumbnails and looking them up
+    thumb = base64.b64encode(b'\xff\xd8' + b'\x00' * 2048 + b'\xff\xd9').decode('utf-8')
+
+    def extract_thumbnails():
+        thumb_dir = tempfile.mkdtemp(dir=work_dir)
+        thumb_manager = app.jsonmanager.JsonManager(App(), OutputTemplate(thumb_dir), HIP_NAME)
+        with thumb_manager.batch():
+            for name in scan_data:
+                thumb_manager.write_item_data(name, {'thumb': thumb})
+        app.thumbstore.extract_inline_thumbnails(thumb_manager, app.thumbstore.ThumbnailStore(thumb_dir, HIP_NAME))
+
+    def load_thumbnails():
+        for item in items:
+            item.load_thumbnail()
+            item.get_thumbnail_path()
+
+    results['thumbnails_extract'] = measure(extract_thumbnails, counted, repeat)
+    results['thumbnails_load'] = measure(load_thumbnails, counted, repeat)
+
+    # catalog indexing and lookups of the panel
+    def fill_catalog():
+        flipbook_catalog = app.catalog.FlipbookCatalog()
+        for item in items:
+            fields = item.get_fields()
+            flipbook_catalog.add(fields['node'], fields['version'], item.get_path(), item)
+        for item in items:
+            flipbook_catalog.next_version(item.get_fields()['node'])
+            flipbook_catalog.get(item.get_path())
+
+    results['catalog_fill'] = measure(fill_catalog, counted, repeat)
+    return results
+
+class SleepEncoder():
+    """
+    Stand-in of the ffmpeg encoder, every encode is a python process that
+    sleeps for encode_time seconds and writes a small movie.
+    """
+    max_jobs = None
+
+    def __init__(self, app, encode_time):
+        self._encode_time = encode_time
+        self._encoder = app.encoder.FFmpegEncoder(sys.executable)
+        self._encoder.command = self.command
+
+    def command(self, job):
+        script = 'import sys, time; time.sleep(%s); open(sys.argv[1], "wb").write(b"0" * 1024)' % self._encode_time
+        return [sys.executable, '-c', script, job.preview_movie_path]
+
+    def output_path(self, frames_path):
+        return self._encoder.output_path(frames_path)
+
+    def encode(self, job):
+        self._encoder.encode(job)
+
+def make_publish_job(app, movie_dir, version, sg_version=None):
+    fields = {'node': 'flip', 'version': version, 'data': {'first_frame': 1001, 'last_frame': 1100}}
+    frames_path = os.path.join(movie_dir, 'flip_v%03d.####.jpg' % version)
+    return app.publisher.PublishJob('flip_v%03d' % version, fields, frames_path, '/flip.hip', [], 24,
+                                    'flip v%03d' % version, sg_version)
+
+def run_publish(app, publish_app, movie_encoder, jobs):
+    """
+    Publishes the jobs and returns the last (status, error, version) sent
+    for every job key.
+    """
+    finished = threading.Event()
+    updates = {}
+
+    def job_changed(key, status, error, progress, version):
+        updates[key] = (status, error, version)
+        if not publish_queue.is_busy():
+            finished.set()
+
+    publish_queue = app.publisher.PublishQueue(publish_app, movie_encoder, movie_encoder.max_jobs or multiprocessing.cpu_count())
+    publish_queue.job_changed.connect(job_changed)
+    publish_queue.submit(jobs)
+    finished.wait()
+    publish_queue.stop()
+    return updates
+
+def bench_publish(app, movie_dir, count, latency, encode_time, repeat):
+    """
+    Publishes count versions through the publish queue against the mock
+    ShotGrid and reports the number of requests made along with the time,
+    once with the nozmov encoder and once with ffmpeg processes.
+    """
+    publish_app = PublishApp(movie_dir, latency, encode_time)
+    encoders = [
+        ('publish_nozmov', app.encoder.NozmovEncoder(publish_app.engine.apps['tk-multi-nozmov'], publish_app, 'preset')),
+        ('publish_ffmpeg', SleepEncoder(app, encode_time))
+        ]
+
+    def publish(movie_encoder):
+        jobs = [make_publish_job(app, movie_dir, index + 1) for index in range(count)]
+        run_publish(app, publish_app, movie_encoder, jobs)
+
+    results = {}
+    for name, movie_encoder in encoders:
+        result = measure(lambda: publish(movie_encoder), [], repeat)
+
+        publish_app.shotgun.requests = {}
+        publish(movie_encoder)
+        result['requests'] = sum(publish_app.shotgun.requests.values())
+        result['requests_by_name'] = publish_app.shotgun.requests
+        results[name] = result
+    return results
+
+def check_publish(app, movie_dir):
+    """
+    Returns a message per broken invariant of the publish queue: the
+    requests of a publish, the errors of a failed batch mapped back to
+    their version and the Version of a failed publish reused.
+    """
+    publish_app = PublishApp(movie_dir, 0, 0)
+    shotgun = publish_app.shotgun
+    movie_encoder = SleepEncoder(app, 0)
+    failures = []
+
+    # every version registers two files, all versions are created by one
+    # batch and every movie is uploaded once
+    updates = run_publish(app, publish_app, movie_encoder, [make_publish_job(app, movie_dir, version) for version in (1, 2, 3)])
+    if shotgun.requests != {'create': 6, 'batch': 1, 'upload': 3}:
+        failures.append('publish requests: %s' % shotgun.requests)
+    if [update[0] for key, update in sorted(updates.items())] != [app.publisher.PublishJob.DONE] * 3:
+        failures.append('publish statuses: %s' % updates)
+
+    # a failed batch only fails the versions that can't be created
+    shotgun.fail_codes = set(['flip v005'])
+    updates = run_publish(app, publish_app, movie_encoder, [make_publish_job(app, movie_dir, version) for version in (4, 5, 6)])
+    statuses = dict((key, update[0]) for key, update in updates.items())
+    if statuses != {'flip_v004': app.publisher.PublishJob.DONE, 'flip_v005': app.publisher.PublishJob.FAILED,
+                    'flip_v006': app.publisher.PublishJob.DONE}:
+        failures.append('failed batch statuses: %s' % updates)
+    elif 'flip v005' not in (updates['flip_v005'][1] or ''):
+        failures.append('failed batch error: %s' % updates['flip_v005'][1])
+    shotgun.fail_codes = set()
+
+    # a version published again reuses its Version, with a batch and one
+    # by one after a failed batch
+    created = len(shotgun.created_versions)
+    updates = run_publish(app, publish_app, movie_encoder, [make_publish_job(app, movie_dir, 5, {'type': 'Version', 'id': 900})])
+    if updates['flip_v005'][2] != {'type': 'Version', 'id': 900}:
+        failures.append('reused version: %s' % (updates['flip_v005'],))
+
+    shotgun.fail_codes = set(['flip v008'])
+    updates = run_publish(app, publish_app, movie_encoder, [make_publish_job(app, movie_dir, 7, {'type': 'Version', 'id': 901}),
+                                                            make_publish_job(app, movie_dir, 8)])
+    if updates['flip_v007'][2] != {'type': 'Version', 'id': 901}:
+        failures.append('reused version after a failed batch: %s' % (updates['flip_v007'],))
+    if len(shotgun.created_versions) != created:
+        failures.append('versions created on a publish again: %s' % shotgun.created_versions[created:])
+    return failures
+
+def bench_upload(app, movie_dir, size, chunk_size, fail_every, repeat):
+    """
+    Uploads a movie of size bytes in parts of chunk_size to the local
+    storage, which drops every fail_every-th part.
+    """
+    storage = LocalStorage(fail_every)
+    shotgun = MockShotgun(0, storage)
+
+    movie_path = os.path.join(movie_dir, 'upload.mov')
+    with open(movie_path, 'wb') as movie:
+        movie.write(os.urandom(size))
+
+    def upload():
+        chunked_uploader = app.uploader.ChunkedUploader(chunk_size, retry_delay=0.01)
+        chunked_uploader.upload(shotgun, 'Version', 1, movie_path, 'sg_uploaded_movie')
+
+    try:
+        result = measure(upload, [], repeat)
+
+        shotgun.requests = {}
+        storage.parts = 0
+        upload()
+        result['requests'] = sum(shotgun.requests.values()) + storage.parts
+        result['requests_by_name'] = dict(shotgun.requests, parts=storage.parts)
+    finally:
+        storage.stop()
+    return {'chunked_upload': result}
+
+def check_upload(app, movie_dir, chunk_size=64 * 1024, parts=8, failed_part=3):
+    """
+    Returns a message per broken invariant of a resumed upload: an upload
+    failing at failed_part is resumed by the next one from that part, with
+    the same upload and without sending the parts before it again.
+    """
+    storage = LocalStorage(failed_part)
+    shotgun = MockShotgun(0, storage)
+
+    movie_path = os.path.join(movie_dir, 'resume.mov')
+    with open(movie_path, 'wb') as movie:
+        movie.write(os.urandom(chunk_size * parts))
+
+    # a single attempt per part so the dropped part fails the upload
+    chunked_uploader = app.uploader.ChunkedUploader(chunk_size, attempts=1, retry_delay=0)
+    failures = []
+    try:
+        try:
+            chunked_uploader.upload(shotgun, 'Version', 1, movie_path, 'sg_uploaded_movie')
+            failures.append('upload: part %d was dropped but the upload succeeded' % failed_part)
+        except Exception:
+            pass
+
+        storage.fail_every = 0
+        sent = list(shotgun.part_numbers)
+        chunked_uploader.upload(shotgun, 'Version', 1, movie_path, 'sg_uploaded_movie')
+        resumed = shotgun.part_numbers[len(sent):]
+
+        if resumed != list(range(failed_part, parts + 1)):
+            failures.append('resumed upload parts: %s after %s' % (resumed, sent))
+        if storage.parts != parts + 1:
+            failures.append('resumed upload stored %d parts for %d' % (storage.parts, parts))
+        if shotgun.requests.get('upload_info') != 1 or shotgun.requests.get('complete') != 1:
+            failures.append('resumed upload requests: %s' % shotgun.requests)
+    finally:
+        storage.stop()
+    return failures
+
+###################################################################################################
+# History
+
+def load_last_run(path):
+    if not os.path.exists(path):
+        return None
+
+    last = None
+    with open(path, 'r') as history:
+        for line in history:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as baseline:
+        return json.load(baseline)
+
+def write_baseline(path, run):
+    # only the counts, the times depend on the machine
+    results = {}
+    for case, case_results in run['results'].items():
+        results[case] = dict((name, dict((key, result[key]) for key in ('syscalls', 'syscalls_by_name', 'requests') if key in result))
+                             for name, result in case_results.items())
+
+    with open(path, 'w') as baseline:
+        json.dump({'time': run['time'], 'results': results}, baseline, indent=2, sort_keys=True)
+        baseline.write('\n')
+
+def find_regressions(run, last, tolerance=None):
+    """
+    Returns a message per benchmark that got slower than tolerance allows,
+    or makes more file system calls or requests than in the last run. The
+    times aren't compared without a tolerance.
+    """
+    regressions = []
+    for case, results in run['results'].items():
+        last_results = last['results'].get(case, {})
+        for name, result in results.items():
+            previous = last_results.get(name)
+            if not previous:
+                continue
+
+            if tolerance is not None and result['wall'] > previous['wall'] * (1 + tolerance):
+                regressions.append('%s %s: %.4fs -> %.4fs' % (case, name, previous['wall'], result['wall']))
+            if result['syscalls'] > previous['syscalls']:
+                regressions.append('%s %s: %d -> %d syscalls' % (case, name, previous['syscalls'], result['syscalls']))
+            if result.get('requests', 0) > previous.get('requests', 0):
+                regressions.append('%s %s: %d -> %d requests' % (case, name, previous.get('requests', 0), result['requests']))
+    return regressions
+
+def print_results(case, results):
+    print('\n%s' % case)
+    print('  %-24s %10s %10s %12s %10s' % ('benchmark', 'wall (s)', 'syscalls', 'peak (KiB)', 'requests'))
+    for name, result in results.items():
+        print('  %-24s %10.4f %10d %12.1f %10s' % (name, result['wall'], result['syscalls'], result['peak_memory'] / 1024.0,
+                                                   result.get('requests', '')))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the flipbook panel.')
+    parser.add_argument('--case', action='append', help='VERSIONSxFRAMES, can be given several times')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark, the fastest is kept')
+    parser.add_argument('--history', default=HISTORY_PATH, help='results history file')
+    parser.add_argument('--save', action='store_true', help='append the results to the history')
+    parser.add_argument('--check', action='store_true', help='exit with 1 if a benchmark regressed')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before a regression')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='file system call and request counts to compare to')
+    parser.add_argument('--write-baseline', action='store_true', help='replace the baseline with the counts of this run')
+    parser.add_argument('--publish', type=int, default=10, help='versions published through the mock ShotGrid, 0 to skip')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds taken by every mock ShotGrid request')
+    parser.add_argument('--encode-time', type=float, default=0.2, help='seconds taken by every stand-in encode')
+    parser.add_argument('--upload', type=int, default=32, help='MB of the movie uploaded in 1MB parts, 0 to skip')
+    parser.add_argument('--fail-every', type=int, default=7, help='the local storage drops every n-th part')
+    args = parser.parse_args(argv)
+
+    app = install_stand_ins()
+
+    run = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {}
+        }
+
+    failures = []
+    temp_dir = tempfile.mkdtemp(prefix='flipbook_bench_')
+    try:
+        for case in args.case or DEFAULT_CASES:
+            versions, frames = parse_case(case)
+            root_path = os.path.join(temp_dir, case)
+            os.makedirs(root_path + '_work')
+            generate_tree(root_path, versions, frames)
+
+            run['results'][case] = bench_case(app, root_path, max(1, args.repeat))
+            print_results(case, run['results'][case])
+
+        movie_dir = os.path.join(temp_dir, 'movies')
+        os.makedirs(movie_dir)
+
+        if args.publish:
+            case = 'publish_%d' % args.publish
+            run['results'][case] = bench_publish(app, movie_dir, args.publish, args.latency, args.encode_time, max(1, args.repeat))
+            print_results(case, run['results'][case])
+            failures.extend(check_publish(app, movie_dir))
+
+        if args.upload:
+            case = 'upload_%dMB' % args.upload
+            run['results'][case] = bench_upload(app, movie_dir, args.upload * 1024 * 1024, 1024 * 1024,
+                                                args.fail_every, max(1, args.repeat))
+            print_results(case, run['results'][case])
+            failures.extend(check_upload(app, movie_dir))
+    finally:
+        shutil.rmtree(temp_dir)
+
+    print('\n%d failed check(s)' % len(failures))
+    for failure in failures:
+        print('  ' + failure)
+
+    regressions = []
+    for name, last, tolerance in (('baseline', load_baseline(args.baseline), None),
+                                  ('last run', load_last_run(args.history), args.tolerance)):
+        if last:
+            found = find_regressions(run, last, tolerance)
+            print('\n%d regression(s) since the %s of %s' % (len(found), name, last['time']))
+            for regression in found:
+                print('  ' + regression)
+            regressions.extend(found)
+
+    if args.write_baseline:
+        write_baseline(args.baseline, run)
+
+    if args.save:
+        with open(args.history, 'a') as history:
+            history.write(json.dumps(run, sort_keys=True) + '\n')
+
+    if args.check and (regressions or failures):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
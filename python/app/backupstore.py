@@ -0,0 +1,155 @@
+import os
+import sys
+import shutil
+import hashlib
+
+from . import perf
+from .fsutils import make_dirs, replace_file
+
+# ioctl cloning a file on file systems with copy on write, Linux only
+FICLONE = 0x40049409
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class BackupStore():
+    """
+    Keeps every distinct backup hip once, as a blob named after its sha1 in
+    '<root>/.<name>_backups', root being the root of the backups. The backup
+    path of a flipbook version is a reflink of the blob where the file
+    system can clone files and a hard link where it can't.
+
+    When neither works the blob would only double the writes, so the store
+    is skipped from then on and backups are plain copies. Blobs are only
+    used to share content with the next backups, removing them never
+    changes a backup.
+    """
+    def __init__(self, root_path, name):
+        self._dir = os.path.join(root_path, '.{}_backups'.format(name))
+        self._linkable = True
+
+        # path -> (size, mtime, sha1) of the files hashed so far
+        self._hashes = {}
+
+    ###################################################################################################
+    # Private methods
+
+    def _hash(self, path):
+        file_stat = os.stat(path)
+        key = (file_stat.st_size, file_stat.st_mtime)
+
+        cached = self._hashes.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as hip_file:
+            for chunk in iter(lambda: hip_file.read(HASH_CHUNK_SIZE), b''):
+                sha1.update(chunk)
+
+        digest = sha1.hexdigest()
+        self._hashes[path] = key + (digest,)
+        return digest
+
+    def _reflink(self, src_path, dst_path):
+        if not sys.platform.startswith('linux'):
+            return False
+
+        import fcntl
+        try:
+            with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except (IOError, OSError):
+            if os.path.exists(dst_path):
+                os.remove(dst_path)
+            return False
+
+    def _place(self, blob_path, backup_path):
+        # put the blob at a temporary path first so the backup path never
+        # holds a partial file, returns False if it couldn't be linked
+        tmp_path = '{}.{}.tmp'.format(backup_path, os.getpid())
+        if not self._reflink(blob_path, tmp_path):
+            try:
+                os.link(blob_path, tmp_path)
+            except (AttributeError, OSError):
+                return False
+
+        replace_file(tmp_path, backup_path)
+        return True
+
+    def _copy(self, src_path, backup_path):
+        tmp_path = '{}.{}.tmp'.format(backup_path, os.getpid())
+        shutil.copyfile(src_path, tmp_path)
+        replace_file(tmp_path, backup_path)
+
+    ###################################################################################################
+    # Public methods
+
+    def blob_path(self, digest):
+        return os.path.join(self._dir, digest[:2], digest)
+
+    def add(self, src_path, backup_path):
+        """
+        Stores src_path unless a blob with the same content exists and
+        places it at backup_path. Returns the sha1 of the content, None
+        once the store is skipped.
+        """
+        with perf.span('backup_hip', path=backup_path) as attrs:
+            make_dirs(os.path.dirname(backup_path))
+            attrs['stored'] = False
+            if not self._linkable:
+                self._copy(src_path, backup_path)
+                return None
+
+            digest = self._hash(src_path)
+            blob_path = self.blob_path(digest)
+            if not os.path.exists(blob_path):
+                attrs['stored'] = True
+                make_dirs(os.path.dirname(blob_path))
+
+                tmp_path = '{}.{}.tmp'.format(blob_path, os.getpid())
+                if not self._reflink(src_path, tmp_path):
+                    shutil.copyfile(src_path, tmp_path)
+                replace_file(tmp_path, blob_path)
+
+            if not self._place(blob_path, backup_path):
+                self._linkable = False
+                self._copy(src_path, backup_path)
+                os.remove(blob_path)
+                return None
+        return digest
+
+    def collect(self, digests):
+        """
+        Removes the blobs whose sha1 isn't in digests, the content of the
+        backups of the versions left.
+        """
+        try:
+            prefixes = os.listdir(self._dir)
+        except OSError:
+            return
+
+        for prefix in prefixes:
+            prefix_dir = os.path.join(self._dir, prefix)
+            try:
+                names = os.listdir(prefix_dir)
+            except OSError:
+                continue
+
+            for name in names:
+                if name not in digests:
+                    try:
+                        os.remove(os.path.join(prefix_dir, name))
+                    except OSError:
+                        pass
+
+def get_root_path(app, backup_template, name):
+    # the deepest directory of the backups of a hip file that doesn't
+    # depend on the flipbook node or version
+    template = backup_template.parent
+    while 'version' in template.keys or 'node' in template.keys:
+        template = template.parent
+
+    fields = {"name": name}
+    fields.update(app.context.as_template_fields(template))
+    return template.apply_fields(fields)
@@ -0,0 +1,192 @@
+import os
+import bisect
+
+class CatalogNode():
+    """
+    All versions of one flipbook name. versions and items are parallel
+    lists sorted by version number.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.versions = []
+        self.items = []
+
+    def latest(self):
+        if self.items:
+            return self.items[-1]
+        return None
+
+    def row_of(self, version, item):
+        row = bisect.bisect_left(self.versions, version)
+        while row < len(self.items) and self.versions[row] == version:
+            if self.items[row] is item:
+                return row
+            row += 1
+        return -1
+
+class FlipbookCatalog():
+    """
+    In-memory index of the flipbook versions of the current file, by node
+    name, by version and by path. Nodes are sorted by name. It doesn't
+    depend on Qt or Houdini, the panel model is a view on top of it.
+
+    Items can be any object, the catalog only stores them along with the
+    node name, version number and path they were added with.
+    """
+    def __init__(self):
+        self._nodes = []
+        self._node_names = []
+        self._nodes_by_name = {}
+        self._node_rows = {}
+
+        # path -> (node, version, item) and version directory -> paths
+        self._by_path = {}
+        self._by_dir = {}
+
+    def __len__(self):
+        return len(self._by_path)
+
+    def __contains__(self, path):
+        return path in self._by_path
+
+    ###################################################################################################
+    # Lookups
+
+    def get(self, path):
+        entry = self._by_path.get(path)
+        if entry:
+            return entry[2]
+        return None
+
+    def get_node(self, name):
+        return self._nodes_by_name.get(name)
+
+    def get_nodes(self):
+        return list(self._nodes)
+
+    def node_at(self, row):
+        return self._nodes[row]
+
+    def node_row(self, node):
+        return self._node_rows.get(node.name, -1)
+
+    def node_insert_row(self, name):
+        """
+        Returns the row a node added for name would get.
+        """
+        return bisect.bisect_left(self._node_names, name)
+
+    def find(self, name, version):
+        node = self._nodes_by_name.get(name)
+        if not node:
+            return None
+
+        row = bisect.bisect_left(node.versions, version)
+        if row < len(node.versions) and node.versions[row] == version:
+            return node.items[row]
+        return None
+
+    def latest(self, name):
+        node = self._nodes_by_name.get(name)
+        if node:
+            return node.latest()
+        return None
+
+    def next_version(self, name):
+        node = self._nodes_by_name.get(name)
+        if node and node.versions:
+            return node.versions[-1] + 1
+        return 1
+
+    def locate(self, path):
+        """
+        Returns (node, row) of the item added with path, or (None, -1).
+        """
+        entry = self._by_path.get(path)
+        if not entry:
+            return None, -1
+
+        node, version, item = entry
+        return node, node.row_of(version, item)
+
+    def items(self):
+        return [item for node in self._nodes for item in node.items]
+
+    def paths(self):
+        return list(self._by_path.keys())
+
+    def items_in_dir(self, dir_path):
+        return [self._by_path[path][2] for path in self._by_dir.get(os.path.normpath(dir_path), [])]
+
+    def dirs(self):
+        return list(self._by_dir.keys())
+
+    ###################################################################################################
+    # Changes
+
+    def add(self, name, version, path, item):
+        """
+        Adds an item and returns (node, row, new_node). An item already
+        added with the same path is replaced.
+        """
+        if path in self._by_path:
+            self.remove(path)
+
+        new_node = name not in self._nodes_by_name
+        if new_node:
+            node = CatalogNode(name)
+            node_row = self.node_insert_row(name)
+            self._nodes.insert(node_row, node)
+            self._node_names.insert(node_row, name)
+            self._nodes_by_name[name] = node
+            self._reindex_nodes(node_row)
+        node = self._nodes_by_name[name]
+
+        row = bisect.bisect_right(node.versions, version)
+        node.versions.insert(row, version)
+        node.items.insert(row, item)
+
+        self._by_path[path] = (node, version, item)
+        self._by_dir.setdefault(os.path.normpath(os.path.dirname(path)), []).append(path)
+        return node, row, new_node
+
+    def remove(self, path):
+        """
+        Removes the item added with path and returns (node, row, node_row,
+        node_removed), node_row being the row the node had before a removal.
+        """
+        entry = self._by_path.pop(path, None)
+        if not entry:
+            return None, -1, -1, False
+
+        node, version, item = entry
+        row = node.row_of(version, item)
+        node.versions.pop(row)
+        node.items.pop(row)
+
+        dir_path = os.path.normpath(os.path.dirname(path))
+        dir_paths = self._by_dir[dir_path]
+        dir_paths.remove(path)
+        if not dir_paths:
+            self._by_dir.pop(dir_path)
+
+        node_row = self._node_rows[node.name]
+        node_removed = not node.items
+        if node_removed:
+            self._nodes.pop(node_row)
+            self._node_names.pop(node_row)
+            self._nodes_by_name.pop(node.name)
+            self._node_rows.pop(node.name)
+            self._reindex_nodes(node_row)
+
+        return node, row, node_row, node_removed
+
+    def clear(self):
+        self.__init__()
+
+    ###################################################################################################
+    # Private methods
+
+    def _reindex_nodes(self, start):
+        for index in range(start, len(self._nodes)):
+            self._node_rows[self._nodes[index].name] = index
@@ -0,0 +1,70 @@
+import os
+from collections import OrderedDict
+
+class ContextState():
+    """
+    What the panel loaded for the flipbooks of one hip file in one
+    context, its metadata, stores and catalog.
+    """
+    def __init__(self, json_manager, thumb_store, backup_store, trash, flipbook_catalog):
+        self.json_manager = json_manager
+        self.thumb_store = thumb_store
+        self.backup_store = backup_store
+        self.trash = trash
+        self.catalog = flipbook_catalog
+
+        # (mtime, size) of the metadata journal when the state was cached
+        self.journal_stat = None
+
+class ContextCache():
+    """
+    Keeps the state of the last max_size contexts the panel left, so going
+    back to one of them reuses its metadata and catalog instead of loading
+    them again. A state whose metadata journal was changed since, for
+    example by another session, is dropped. So is a state left while its
+    journal is being compacted, as the compaction changes the journal
+    once it is done.
+    """
+    def __init__(self, max_size=4):
+        self._max_size = max_size
+        self._states = OrderedDict()
+
+    ###################################################################################################
+    # Private methods
+
+    def _journal_stat(self, state):
+        try:
+            stat = os.stat(state.json_manager.get_journal_path())
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    ###################################################################################################
+    # Public methods
+
+    def put(self, key, state):
+        self._states.pop(key, None)
+        if self._max_size <= 0:
+            return
+
+        state.json_manager.flush()
+        if state.json_manager.is_compacting():
+            return
+        state.journal_stat = self._journal_stat(state)
+
+        self._states[key] = state
+        while len(self._states) > self._max_size:
+            self._states.popitem(last=False)
+
+    def take(self, key):
+        """
+        Returns the state cached for key and removes it from the cache, or
+        None when there is none or it is out of date.
+        """
+        state = self._states.pop(key, None)
+        if state and state.journal_stat != self._journal_stat(state):
+            return None
+        return state
+
+    def clear(self):
+        self._states.clear()
@@ -0,0 +1,78 @@
+import os
+import hou
+
+# file parm of every node type whose files are dependencies of a publish,
+# types can be given as 'Category/type' to only match one category
+DEFAULT_FILE_PARMS = {
+    'alembicarchive': 'fileName',
+    'abc_cam': 'abcFile',
+    'sgtk_file': 'filepath',
+    'arnold_procedural': 'ar_filename'
+    }
+
+class DependencyScanner():
+    """
+    Collects the files the current scene depends on. Only the instances of
+    the node types of the table are looked at instead of walking the whole
+    scene, and the result is kept until the hip file is saved, loaded,
+    merged or cleared.
+    """
+    def __init__(self, file_parms=None):
+        self._file_parms = file_parms or DEFAULT_FILE_PARMS
+        self._paths = None
+
+        hou.hipFile.addEventCallback(self._hip_file_event)
+
+    ###################################################################################################
+    # Private methods
+
+    def _hip_file_event(self, event_type):
+        if event_type in (hou.hipFileEventType.AfterSave, hou.hipFileEventType.AfterLoad,
+                          hou.hipFileEventType.AfterMerge, hou.hipFileEventType.AfterClear):
+            self._paths = None
+
+    def _node_types(self, type_name):
+        # the node types of a table entry, in one or all categories
+        if '/' in type_name:
+            category_name, type_name = type_name.split('/', 1)
+            categories = [hou.nodeTypeCategories().get(category_name)]
+        else:
+            categories = hou.nodeTypeCategories().values()
+
+        node_types = []
+        for category in categories:
+            node_type = category.nodeType(type_name) if category else None
+            if node_type:
+                node_types.append(node_type)
+        return node_types
+
+    def _scan(self):
+        paths = set()
+        for type_name, parm_name in iter(self._file_parms.items()):
+            for node_type in self._node_types(type_name):
+                for node in node_type.instances():
+                    if node.isInsideLockedHDA():
+                        continue
+
+                    parm = node.parm(parm_name)
+                    hou_path = parm.eval() if parm else None
+                    if hou_path:
+                        paths.add(hou_path.replace("/", os.path.sep).replace('$F4', '%04d'))
+        return sorted(paths)
+
+    ###################################################################################################
+    # Public methods
+
+    def get_paths(self):
+        if self._paths is None:
+            self._paths = self._scan()
+        return list(self._paths)
+
+    def invalidate(self):
+        self._paths = None
+
+    def stop(self):
+        try:
+            hou.hipFile.removeEventCallback(self._hip_file_event)
+        except hou.OperationFailed:
+            pass
@@ -14,11 +14,10 @@ from sgtk.platform.qt import QtCore, QtGui
 import os
 import hou
 import sys
-import subprocess
-import shutil
+import copy
 import time
 
-from . import jsonmanager, treeitem, helpers
+from . import backupstore, catalog, contextcache, dependencies, encoder, flipbookmodel, jsonmanager, perf, perfview, prefetch, publisher, quota, rendermonitor, scanner, scanworker, thumbbackend, thumbscheduler, thumbstore, trash, treeitem, watcher, helpers
 
 class AppDialog(QtGui.QWidget):
     @property
@@ -44,36 +43,114 @@ class AppDialog(QtGui.QWidget):
 
         self.movie_preset = self._app.get_setting("Nozon Preview Movie Preset")
 
-        self._json_manager = jsonmanager.JsonManager(self._app, self._output_template, self._get_hipfile_name())
+        max_jobs = self._app.get_setting("thumbnail_max_jobs", 4)
+        backends = [thumbbackend.FFmpegBackend(self.get_ffmpeg_exec)]
+        if self._app.get_setting("thumbnail_backend", "qt") == "qt":
+            backends.insert(0, thumbbackend.QtImageBackend(max_jobs))
+        self._thumb_scheduler = thumbscheduler.ThumbnailScheduler(self, backends, max_jobs)
+
+        # timings of the panel, written to a rotating log in the cache of the app
+        if self._app.get_setting("perf_log", True):
+            perf.get_log().set_log_file(os.path.join(self._app.cache_location, 'perf.log'))
+
+        # state of the background refresh
+        self._refresh_generation = 0
+        self._refresh_unchecked = set()
+        self._refresh_started = None
+        self._scan_worker = None
+        self._scan_workers = []
+
+        self._watcher = watcher.FlipbookWatcher(self, self._app.get_setting("watch_mode", "watch"),
+                                                self._app.get_setting("watch_poll_interval", 2000))
+        self._watcher.root_changed.connect(self._root_changed)
+        self._watcher.dirs_changed.connect(self._version_dirs_changed)
+
+        # versions being written by a flipbook
+        self._render_monitor = rendermonitor.RenderMonitor(self)
+        self._render_monitor.progress.connect(self._render_progress)
+        self._render_monitor.finished.connect(self._render_finished)
+
+        # publishes running in the background, by item key, the queue and
+        # the dependency scanner are created by the first publish
+        self._dependency_scanner = None
+        self._publish_queue = None
+        self._publish_items = {}
+
+        # unpublished versions evicted when the flipbooks outgrow the quota
+        self._quota = quota.QuotaPolicy(self._app.get_setting("quota_mb", 0) * 1024 * 1024,
+                                        self._app.get_setting("quota_order", quota.OLDEST))
+
+        # warms the cache with the frames of the flipbooks loaded into mplay
+        self._prefetcher = None
+        if self._app.get_setting("prefetch_mode", "on") == "on":
+            self._prefetcher = prefetch.Prefetcher(self._app.get_setting("prefetch_max_jobs", 8),
+                                                   self._app.get_setting("prefetch_budget_mb", 2048) * 1024 * 1024)
+
+        # state of the contexts shown recently, by (root path, hip name)
+        self._context_cache = contextcache.ContextCache(self._app.get_setting("context_cache_size", 4))
+
+        self._catalog = catalog.FlipbookCatalog()
+        self._create_stores()
         self._column_names = helpers.ColumnNames()
         self._setup_ui()
-        self._refresh_treewidget()
+
+        # show the panel before the metadata is read and the flipbooks scanned
+        self._first_load_pending = True
+        QtCore.QTimer.singleShot(0, self._first_load)
 
     ###################################################################################################
     # UI callbacks
 
-    def _set_flipbook_name_sel(self, item, column):
-        if isinstance(item, treeitem.TreeItem):
-            self._name_line.setText(item.get_fields()['node'])
-        else:
-            self._name_line.setText(item.text(0))
+    def _set_flipbook_name_sel(self, index):
+        node = self._model.node_from_index(index)
+        if isinstance(node, treeitem.TreeItem):
+            self._name_line.setText(node.get_fields()['node'])
+        elif node:
+            self._name_line.setText(node.name)
 
     def _del_flipbooks(self):
-        for item in self._tree_find_selected():
-            # Only delete if not published
-            if item.get_fields()['data']['publish'] == False:
-                item.remove_cache()
+        # Only delete if not published
+        items = [item for item in self._tree_find_selected() if item.get_fields()['data']['publish'] == False]
 
-        self._json_manager.remove_item(item.get_fields()['json_name'])
-        self._refresh_treewidget()
+        # the publish of a version still needs its frames
+        publishing = [item for item in items if item.get_key() in self._publish_items]
+        if publishing:
+            helpers.MessageBox(self, 'Not deleting flipbooks being published: %s' % ', '.join(item.get_key() for item in publishing))
+
+        self._delete_items([item for item in items if item.get_key() not in self._publish_items])
+
+    def _delete_items(self, items):
+        items_by_dir = {}
+        for item in items:
+            items_by_dir.setdefault(os.path.dirname(item.get_path()), []).append(item)
+
+        # move the directories to the trash and purge it in the background
+        with self._json_manager.batch():
+            for dir_path, dir_items in iter(items_by_dir.items()):
+                try:
+                    self._trash.move(dir_path, [item.get_key() for item in dir_items])
+                except OSError as e:
+                    self._app.log_error("Could not delete %s: %s" % (dir_path, e))
+                    continue
 
-    def _item_double_clicked(self, item, column):
+                for item in dir_items:
+                    self._remove_tree_item(item)
+                    self._remove_item_data(item.get_key())
+
+        self._trash.purge()
+
+        # drop the backup blobs no version uses anymore
+        digests = set(self._json_manager.get_item_data(item_name).get('backup_sha1') for item_name in self._json_manager.item_names())
+        self._backup_store.collect(digests)
+
+    def _item_double_clicked(self, index):
+        item = self._model.node_from_index(index)
         if isinstance(item, treeitem.TreeItem):
             comment_index = self._column_names.index_name('comment')
-            if column != comment_index:
+            if index.column() != comment_index:
                 self._load_flipbooks()
             else:
-                current_comment = item.text(comment_index)
+                current_comment = item.get_comment()
 
                 text, ok = QtGui.QInputDialog().getText(self, 'Set new comment', 'Comment:', text=current_comment)
                 
@@ -82,16 +159,35 @@ class AppDialog(QtGui.QWidget):
                     fields = item.get_fields()
                     self._json_manager.write_item_data(fields['json_name'], fields['data'])
 
-    def _item_expanded(self, item):
-        for index in range(item.childCount()):
-            item.child(index).load_thumbnail()
+    def _item_expanded(self, index):
+        # thumbnails are requested by the delegate for the rows it paints
+        self._tree_view.header().resizeSections(QtGui.QHeaderView.ResizeToContents)
+
+    def _item_collapsed(self, index):
+        group = self._model.node_from_index(index)
+        self._thumb_scheduler.cancel([item.get_key() for item in group.items])
+
+    def _tree_scrolled(self, value):
+        # fetch the next versions of the expanded groups at the bottom
+        if value == self._tree_view.verticalScrollBar().maximum():
+            for group in self._catalog.get_nodes():
+                group_index = self._model.group_index(group)
+                if self._tree_view.isExpanded(group_index) and self._model.canFetchMore(group_index):
+                    self._model.fetchMore(group_index)
 
-        self._tree_widget.header().resizeSections(QtGui.QHeaderView.ResizeToContents)
+        self._thumb_scheduler.prioritize([item.get_key() for item in self._visible_items()])
 
     def _load_flipbooks(self):
         item_paths = []
-        for item in self._tree_find_selected():
-            item_paths.append(item.get_path())
+        frame_paths = []
+        with self._json_manager.batch():
+            for item in self._tree_find_selected():
+                item_paths.append(item.get_path())
+                frame_paths.extend(item.get_frame_paths())
+
+                # the quota evicts the least recently viewed versions first
+                item.viewed()
+                self.write_item_data(item)
 
         item_paths = ' '.join(item_paths)
 
@@ -112,6 +208,10 @@ class AppDialog(QtGui.QWidget):
                 hou.ui.displayMessage(msg)
                 return
 
+            # mplay reads the first frames while the rest are fetched
+            if self._prefetcher:
+                self._prefetcher.prefetch(frame_paths)
+
             process.startDetached(program, arguments.split(' '))
             process.close()
 
@@ -126,100 +226,71 @@ class AppDialog(QtGui.QWidget):
         # Get item selection before refreshing the data
         items = self._tree_find_selected()
 
-        # Make sure everything is up to date and saved
-        self._refresh_treewidget()
+        if not self._app.engine.apps.get("tk-multi-nozmov") and not os.path.exists(self.get_ffmpeg_exec() or ''):
+            helpers.MessageBox(self, 'tk-multi-nozmov app not found and ffmpeg not set, can\'t encode preview movies!')
+            return
+
+        # get caches in scene, including sgtk_file's in out mode
+        refs = self._get_dependency_scanner().get_paths()
+
+        # Make sure the selected items are up to date and saved
+        with self._json_manager.batch():
+            for item in items:
+                item.refresh()
+                self.write_item_data(item)
 
-        # Loop over selected items
+        # Queue the selected items, the publish runs in the background
+        jobs = []
         for item in items:
             item_fields = item.get_fields()
             
             # Check if it is already published
             if item_fields['data']['publish'] == True:
-                break
-
-            # get caches in scene, including sgtk_file's in out mode
-            refs = []
-
-            for n in hou.node("/obj").allSubChildren(recurse_in_locked_nodes=False):
-                hou_path = None
-                node_type = n.type().name()
-                if node_type == "alembicarchive":
-                    hou_path = n.parm("fileName").eval().replace("/", os.path.sep)
-                elif node_type == "abc_cam":
-                    hou_path = n.parm("abcFile").eval().replace("/", os.path.sep)
-                elif node_type == "sgtk_file":
-                    hou_path = n.parm("filepath").eval().replace("/", os.path.sep)
-                elif node_type == 'arnold_procedural':
-                    hou_path = n.parm("ar_filename").eval().replace("/", os.path.sep)
-
-                if hou_path:
-                    refs.append(hou_path.replace('$F4', '%04d'))
-            
-            # remove duplicate caches
-            refs = list(set(refs))
+                continue
 
-            # publish backup hip and sequence
             backup_hip_path = self._output_backup_template.apply_fields(item_fields)
-            sgtk.util.register_publish(self._app.sgtk, self._app.context, backup_hip_path, item_fields['node'], published_file_type="Backup File", version_number=item_fields['version'], dependency_paths=refs)
+            version_info = "{} {} {} - v{:03d}".format(self._app.context.entity['name'], item_fields['node'], self._app.context.step['name'], item_fields['version'])
 
-            publish_data_frames = sgtk.util.register_publish(self._app.sgtk, self._app.context, item.get_path().replace('$F4', '####'), item_fields['node'], published_file_type="Playblast", version_number=item_fields['version'], dependency_paths=[backup_hip_path])
-            
-            self._app.log_debug("Published backup file and flipbook for %s" % item_fields['node'])
+            job = publisher.PublishJob(item.get_key(), copy.deepcopy(item_fields), item.get_path().replace('$F4', '####'),
+                                       backup_hip_path, refs, hou.fps(), version_info, item_fields['data'].get('sg_version'))
+            self._publish_items[job.key] = (self._json_manager, item)
+            jobs.append(job)
 
-            # Create preview movie
-            nozmov_app = self._app.engine.apps.get("tk-multi-nozmov")
-            if not nozmov_app:
-                self.logger.error("Error : tk-multi-nozmov app not found")
-                raise Exception("Error : tk-multi-nozmov app not found")
+        self._get_publish_queue().submit(jobs)
 
-            preview_movie_path = nozmov_app.calc_output_filepath(item.get_path().replace('$F4', '####'), self.movie_preset)
-            version_info = "{} {} {} - v{:03d}".format(self._app.context.entity['name'], item_fields['node'], self._app.context.step['name'], item_fields['version'])
+    def _publish_job_changed(self, key, status, error, progress, version):
+        # the item and metadata of the context the version was published
+        # from, the panel may show another context by now
+        json_manager, item = self._publish_items.get(key, (None, None))
+        if item:
+            item.set_publish_status(None if status == publisher.PublishJob.DONE else publisher.PublishJob.describe(status, progress), error)
 
-            nozmov_app.noz_movie(in_file = item.get_path().replace('$F4', '####'),
-                                out_file = preview_movie_path,
-                                first_frame = item_fields['data']['first_frame'],
-                                last_frame = item_fields['data']['last_frame'],
-                                framerate = hou.fps(),
-                                preset_name = self.movie_preset,
-                                user_name = self._app.context.user['name'],
-                                version_info = version_info,
-                                publish_hook=self._app) 
-            # Create the movie file
-            nozmov_app.execute()
-
-            # Create the version in Shotgun
-            data = {
-                "code": version_info,
-                "sg_status_list": "rev",
-                "entity": self._app.context.entity,
-                "sg_task": self._app.context.task,
-                "sg_first_frame": item_fields['data']['first_frame'],
-                "sg_last_frame": item_fields['data']['last_frame'],
-                "frame_count": (item_fields['data']['last_frame'] - item_fields['data']['first_frame'] + 1),
-                "frame_range": "%s-%s" % (item_fields['data']['first_frame'], item_fields['data']['last_frame']),
-                "sg_frames_have_slate": False,
-                "created_by": self._app.context.user,
-                "updated_by": self._app.context.user,
-                "user": self._app.context.user,
-                "description": item_fields['data'].get('comment'),
-                "sg_path_to_frames": item.get_path().replace('$F4', '####'),
-                "sg_movie_has_slate": False,
-                "project": self._app.context.project,
-                "sg_path_to_movie": preview_movie_path,
-                "published_files": [publish_data_frames],
-                }
-
-            version = self._app.shotgun.create("Version", data)
-            
-            time.sleep(1)
-            
-            self._app.shotgun.upload("Version", version["id"], preview_movie_path, "sg_uploaded_movie")
+            # keep the version created so a failed publish can reuse it
+            data = item.get_fields()['data']
+            if version and data.get('sg_version') != version:
+                data['sg_version'] = version
+                json_manager.write_item_data(item.get_key(), data)
 
             # set published
-            item.published()
+            if status == publisher.PublishJob.DONE:
+                item.published()
+                if self._catalog.get(item.get_path()) is item:
+                    item.refresh()
+                json_manager.write_item_data(item.get_key(), item.get_fields()['data'])
 
-        # Make sure everything is up to date and saved
-        self._refresh_treewidget()
+        # every job reports its final status once
+        if publisher.PublishJob.is_final(status):
+            self._publish_items.pop(key, None)
+
+            # Make sure everything is up to date and saved
+            if not self._publish_items:
+                self._refresh_treewidget()
+
+        self._cancel_publish_but.setVisible(bool(self._publish_items))
+
+    def _cancel_publish(self):
+        if self._publish_queue:
+            self._publish_queue.cancel_all()
 
     def _create_flipbook(self):
         # Ranges
@@ -259,12 +330,7 @@ class AppDialog(QtGui.QWidget):
             settings.useResolution(False)
 
             # Check if there are already flipbook versions in tree
-            ver = 1
-            for top_level in range(self._tree_widget.topLevelItemCount()):
-                top_level_widget = self._tree_widget.topLevelItem(top_level)
-                if top_level_widget.text(0) == flip_name:
-                    tree_item = top_level_widget.child(top_level_widget.childCount() - 1)
-                    ver = tree_item.get_fields()['version'] + 1
+            ver = self._catalog.next_version(flip_name)
 
             # create path
             # get relevant fields from the current file path
@@ -277,129 +343,317 @@ class AppDialog(QtGui.QWidget):
 
             fields.update(self._app.context.as_template_fields(self._output_template))
 
-            path_flipbook = self._output_template.apply_fields(fields)
-            path_flipbook = path_flipbook.replace(os.sep, '/')
-            settings.output(path_flipbook)
+            # Create dir to reserve slot, a scan still running may not have
+            # found every version yet so versions already on disk are skipped
+            while True:
+                path_flipbook = self._output_template.apply_fields(fields)
+                try:
+                    os.makedirs(os.path.dirname(path_flipbook))
+                    break
+                except OSError as e:
+                    if not os.path.isdir(os.path.dirname(path_flipbook)):
+                        self._app.log_error("Could not create %s: %s" % (os.path.dirname(path_flipbook), e))
+                        helpers.MessageBox(self, 'Could not create the flipbook directory!')
+                        return
+                fields['version'] += 1
+            self._watch_root()
 
-            # Create dir to reserve slot
-            os.makedirs(os.path.dirname(path_flipbook))
+            settings.output(path_flipbook.replace(os.sep, '/'))
 
             # create comment
             comment = self._comment_line.text()
-            self._add_path_to_tree(path_flipbook, comment)
-
-            hou.hipFile.save()
-            backup_path = self._output_backup_template.apply_fields(fields)
+            new_item = self._add_path_to_tree(path_flipbook, comment)
 
-            # Create dir if it doesn't exist
-            backup_dir_path = os.path.dirname(backup_path)
-            if not os.path.exists(backup_dir_path):
-                os.makedirs(backup_dir_path)
-
-            # write backup hip
+            # write backup hip, the saved file is stored once per content
+            # and linked to the backup path
             hou.hipFile.save(file_name=None, save_to_recent_files=True)
 
-            shutil.copy2(hou.hipFile.path(), backup_path)
+            backup_path = self._output_backup_template.apply_fields(fields)
+            digest = self._backup_store.add(hou.hipFile.path(), backup_path)
+            if new_item and digest:
+                # keeps its blob from being collected
+                data = new_item.get_fields()['data']
+                data['backup_sha1'] = digest
+                self._json_manager.write_item_data(new_item.get_key(), data)
             self._app.log_debug("Created backup file for %s" % fields['node'])
 
-            # Create flipbook
-            sceneViewer.flipbook(sceneViewer.curViewport(), settings)
+            # Create flipbook, the frames are all written once it returns
+            if new_item:
+                self._render_monitor.watch(new_item.get_key(), path_flipbook, int(range_begin), int(range_end))
+            try:
+                with perf.span('flipbook', version=os.path.basename(path_flipbook).split('.')[0],
+                               frames=int(range_end) - int(range_begin) + 1):
+                    sceneViewer.flipbook(sceneViewer.curViewport(), settings)
+            finally:
+                if new_item:
+                    self._render_monitor.complete(new_item.get_key())
 
         # Make sure everything is up to date and saved
         self._refresh_treewidget()
 
     def _refresh_treewidget(self):
-        # Get all items in tree
-        items = {}
-        for top_level in range(self._tree_widget.topLevelItemCount()):
-            top_level_widget = self._tree_widget.topLevelItem(top_level)
-
-            for index in range(top_level_widget.childCount()):
-                child = top_level_widget.child(index)
-                items[child.get_path()] = {'item': child, 'checked': False}
-
-        # get relevant fields from the current file path
-        fields = { 
-            "name": self._get_hipfile_name(),
-            "SEQ": "FORMAT: $F"
-            }
-
-        fields.update(self._app.context.as_template_fields(self._output_template))
-
-        flipbooks = self._app.sgtk.abstract_paths_from_template(self._output_template, fields)
-        flipbooks.sort()
-
-        # Add new flipbooks
-        for flip in flipbooks:
-            if flip not in items.keys():
-                self._add_path_to_tree(flip)
-            else:
-                items[flip]['checked'] = True
-        
-        # Check for any missing flipbooks on disk
-        for key, value in iter(items.items()):
-            if not value['checked']:
-                parent = value['item'].parent()
-                parent.removeChild(value['item'])
-
-                if not parent.childCount():
-                    index = self._tree_widget.indexOfTopLevelItem(parent)
-                    self._tree_widget.takeTopLevelItem(index)
-
-        # Refresh items that are visible
-        for top_level in range(self._tree_widget.topLevelItemCount()):
-            top_level_item = self._tree_widget.topLevelItem(top_level)
-            if top_level_item.isExpanded():
-                for index in range(top_level_item.childCount()):
-                    top_level_item.child(index).refresh()
-                    fields = top_level_item.child(index).get_fields()
-                    self._json_manager.write_item_data(fields['json_name'], fields['data'])
+        # a new refresh supersedes the one that is running
+        self._refresh_generation += 1
+        if self._scan_worker:
+            self._scan_worker.cancel()
+
+        # paths of the catalog not found again by the scan are removed
+        self._refresh_unchecked = set(self._catalog.paths())
+        self._refresh_started = time.time()
+
+        worker = scanworker.ScanWorker(self._refresh_generation, self._json_manager.get_root_path(),
+                                       self._get_path_parser(), self._get_scan_cache(), self)
+        worker.batch_ready.connect(self._scan_batch_ready)
+        worker.progress.connect(self._scan_progress)
+        worker.scan_done.connect(self._scan_done)
+        worker.finished.connect(self._scan_worker_finished)
+
+        self._scan_worker = worker
+        self._scan_workers.append(worker)
+
+        self._progress_bar.setRange(0, 0)
+        self._progress_bar.show()
+        worker.start()
+
+    def _scan_batch_ready(self, generation, versions):
+        if generation != self._refresh_generation:
+            return
 
-    ###################################################################################################
-    # Private Functions
+        # write all metadata changes of this batch at once
+        with self._json_manager.batch():
+            for version in versions:
+                self._refresh_unchecked.discard(version.path)
 
-    def _fill_treewidget(self):
-        self._tree_widget.invisibleRootItem().takeChildren()
+                item = self._catalog.get(version.path)
+                if not item:
+                    self._add_path_to_tree(version.path, scan=version)
+                    continue
 
-        # get relevant fields from the current file path
-        fields = { 
-            "name": self._get_hipfile_name(),
-            "SEQ": "FORMAT: $F"
-            }
+                item.set_scan(version)
 
-        fields.update(self._app.context.as_template_fields(self._output_template))
+                # Refresh items that are visible
+                if self._tree_view.isExpanded(self._model.group_index(self._catalog.get_node(item.get_fields()['node']))):
+                    item.refresh()
+                    self.write_item_data(item)
 
-        flipbooks = self._app.sgtk.abstract_paths_from_template(self._output_template, fields)
-        flipbooks.sort()
+    def _scan_progress(self, generation, done, total):
+        if generation == self._refresh_generation:
+            self._progress_bar.setRange(0, total)
+            self._progress_bar.setValue(done)
 
-        for flip in flipbooks:
-            self._add_path_to_tree(flip)
+    def _scan_done(self, generation, completed, version_dirs):
+        if generation != self._refresh_generation:
+            return
 
-        for index in range(self._tree_widget.topLevelItemCount()):
-            self._tree_widget.topLevelItem(index).setExpanded(False)
+        self._scan_worker = None
+        self._progress_bar.hide()
+        perf.record('refresh', self._refresh_started, time.time() - self._refresh_started,
+                    completed=completed, versions=len(self._catalog))
+
+        # Check for any missing flipbooks on disk, only a complete scan can tell
+        if completed:
+            for path in self._refresh_unchecked:
+                item = self._catalog.get(path)
+                if item:
+                    self._remove_tree_item(item)
+
+            self._watch_root()
+            self._watcher.set_version_dirs(version_dirs)
+            self._enforce_quota()
+
+        self._refresh_unchecked = set()
+        self._thumb_scheduler.prioritize([item.get_key() for item in self._visible_items()])
+
+    def _watch_root(self):
+        # the root of a new file only exists once its first flipbook is created
+        if not self._watcher.is_watching():
+            self._watcher.set_root(self._json_manager.get_root_path())
+
+    def _enforce_quota(self):
+        # versions being published or written are still unpublished, keep them
+        keep = set(self._publish_items)
+        keep.update(render.key for render in self._render_monitor.get_renders())
+        evicted = self._quota.select(self._catalog.items(), keep=keep)
+        if evicted:
+            self._app.log_info("Deleting %s unpublished flipbooks over the quota: %s" % (len(evicted), ', '.join(item.get_key() for item in evicted)))
+            self._delete_items(evicted)
+
+    def _root_changed(self):
+        # add the versions of new directories and drop the removed ones
+        root_path = self._json_manager.get_root_path()
+        version_dirs = [os.path.normpath(dir_path) for dir_path, entry in scanner.list_version_dirs(root_path)]
+        known_dirs = set(self._catalog.dirs())
+
+        with self._json_manager.batch():
+            parse_path = self._get_path_parser()
+            for dir_path in version_dirs:
+                if dir_path not in known_dirs:
+                    for version in scanner.scan_version_dir(dir_path, parse_path):
+                        self._add_path_to_tree(version.path, scan=version)
+
+            for dir_path in known_dirs.difference(version_dirs):
+                for item in self._catalog.items_in_dir(dir_path):
+                    self._remove_tree_item(item)
+
+        self._watcher.set_version_dirs(version_dirs)
+
+    def _version_dirs_changed(self, dir_paths):
+        # only rescan the rows of the directories that changed
+        with self._json_manager.batch():
+            parse_path = self._get_path_parser()
+            for dir_path in dir_paths:
+                # the render monitor follows the versions being written
+                if self._render_monitor.is_watching_dir(dir_path):
+                    continue
+
+                items = self._catalog.items_in_dir(dir_path)
+                if not os.path.isdir(dir_path):
+                    for item in items:
+                        self._remove_tree_item(item)
+                elif items:
+                    for item in items:
+                        item.set_scan(scanner.scan_sequence(item.get_path(), fields=item.get_fields()))
+                        item.update_range()
+                        self.write_item_data(item)
+                else:
+                    for version in scanner.scan_version_dir(dir_path, parse_path):
+                        self._add_path_to_tree(version.path, scan=version)
+
+    def _render_progress(self, render):
+        item = self._catalog.get(render.path)
+        if item:
+            item.set_render_status(render.status())
+
+    def _render_finished(self, render):
+        item = self._catalog.get(render.path)
+        if item:
+            item.set_render_status(None)
+            if render.scan:
+                item.set_scan(render.scan)
+            item.update_range()
+            self.write_item_data(item)
+
+    def _scan_worker_finished(self):
+        for worker in list(self._scan_workers):
+            if worker.isFinished():
+                self._scan_workers.remove(worker)
+                worker.deleteLater()
 
-    def _add_path_to_tree(self, path, comment=None):
-        fields = self._output_template.get_fields(path)
+    ###################################################################################################
+    # Private Functions
 
-        if 'node' in fields:
-            name = fields['node']
+    def _first_load(self):
+        # a context change may have loaded the metadata already
+        if not self._first_load_pending:
+            return
 
-            flip_top_level_item = None
-            
-            # check if the flipbook name is already in tree
-            for top_level in range(self._tree_widget.topLevelItemCount()):
-                top_level_item = self._tree_widget.topLevelItem(top_level)
+        with perf.span('first_load'):
+            self._load_metadata()
+            self._refresh_treewidget()
+
+    def _get_context_key(self):
+        name = self._get_hipfile_name()
+        return (jsonmanager.get_root_path(self._app, self._output_template, name), name)
+
+    def _create_stores(self):
+        # the journal is read by _load_metadata, or by the first action
+        # needing it if that comes first
+        name = self._get_hipfile_name()
+        self._context_key = self._get_context_key()
+        self._json_manager = jsonmanager.JsonManager(self._app, self._output_template, name, load=False)
+        self._thumb_store = thumbstore.ThumbnailStore(self._json_manager.get_root_path(), name)
+        self._backup_store = backupstore.BackupStore(backupstore.get_root_path(self._app, self._output_backup_template, name), name)
+        self._trash = trash.Trash(self._json_manager.get_root_path())
+
+    def _load_metadata(self):
+        self._first_load_pending = False
+        self._json_manager.load()
+
+        # finish the deletes a crash interrupted
+        with self._json_manager.batch():
+            for item_name in self._trash.recover():
+                self._remove_item_data(item_name)
+        self._trash.purge()
+        thumbstore.extract_inline_thumbnails(self._json_manager, self._thumb_store)
+        self._watcher.set_root(self._json_manager.get_root_path())
+
+    def _save_context_state(self):
+        state = contextcache.ContextState(self._json_manager, self._thumb_store, self._backup_store, self._trash, self._catalog)
+        self._context_cache.put(self._context_key, state)
+
+    def _restore_context_state(self, key):
+        state = self._context_cache.take(key)
+        if not state:
+            return False
+
+        self._context_key = key
+        self._json_manager = state.json_manager
+        self._thumb_store = state.thumb_store
+        self._backup_store = state.backup_store
+        self._trash = state.trash
+        self._catalog = state.catalog
+        self._watcher.set_root(self._json_manager.get_root_path())
+        return True
 
-                if top_level_item.text(0) == name:
-                    flip_top_level_item = top_level_item
-                    break
-            
-            # create new top level item or add version
-            if not flip_top_level_item:
-                flip_top_level_item = QtGui.QTreeWidgetItem([name, '', '', ''])
-                self._tree_widget.addTopLevelItem(flip_top_level_item)
-                flip_top_level_item.setExpanded(True)
+    def _remove_item_data(self, item_name):
+        self._json_manager.remove_item(item_name)
+        self._thumb_store.remove(item_name)
+
+    def _get_publish_queue(self):
+        if not self._publish_queue:
+            movie_encoder = self._get_movie_encoder()
+            encode_max_jobs = movie_encoder.max_jobs or self._app.get_setting("encode_max_jobs", 0) or encoder.default_max_jobs()
+            self._publish_queue = publisher.PublishQueue(self._app, movie_encoder, encode_max_jobs,
+                                                         self._app.get_setting("upload_max_jobs", 2), self)
+            self._publish_queue.job_changed.connect(self._publish_job_changed)
+        return self._publish_queue
+
+    def _get_dependency_scanner(self):
+        if not self._dependency_scanner:
+            self._dependency_scanner = dependencies.DependencyScanner(self._app.get_setting("dependency_file_parms"))
+        return self._dependency_scanner
+
+    def _get_movie_encoder(self):
+        # preview movies are encoded with the nozmov preset, or directly
+        # with ffmpeg when the app isn't there
+        nozmov_app = self._app.engine.apps.get("tk-multi-nozmov")
+        if nozmov_app:
+            return encoder.NozmovEncoder(nozmov_app, self._app, self.movie_preset)
+
+        self._app.log_warning("tk-multi-nozmov app not found, preview movies are encoded with ffmpeg")
+        return encoder.FFmpegEncoder(self.get_ffmpeg_exec())
+
+    def _get_path_parser(self):
+        name = self._get_hipfile_name()
+        template = self._output_template
+
+        def parse_path(path):
+            if template.validate(path):
+                fields = template.get_fields(path)
+                if fields.get('name') == name:
+                    return fields
+            return None
+
+        return parse_path
+
+    def _get_scan_cache(self):
+        # the scan results stored with the metadata avoid listing
+        # directories that didn't change
+        cache = {}
+        for item_name in self._json_manager.item_names():
+            data = self._json_manager.get_item_data(item_name)
+            if 'path' in data.get('scan', {}):
+                version = scanner.ScanVersion.from_cache(None, data)
+                cache[version.dir_path] = version
+        return cache
+
+    def _add_path_to_tree(self, path, comment=None, scan=None):
+        if path in self._catalog:
+            return self._catalog.get(path)
 
+        fields = self._output_template.get_fields(path)
+
+        if 'node' in fields:
             # get json data
             name_version = os.path.basename(path).split('.')[0]
             fields['data'] = self._json_manager.get_item_data(name_version)
@@ -409,15 +663,24 @@ class AppDialog(QtGui.QWidget):
                 
             fields['json_name'] = name_version
             
-            # create new item and add to widget
-            new_item = treeitem.TreeItem(self._column_names, path, fields, self)
-            flip_top_level_item.addChild(new_item)
+            # create new item and add to the model
+            new_item = treeitem.TreeItem(path, fields, self, scan)
+            self._model.add_item(new_item)
             
             # update json
             fields = new_item.get_fields()
             self._json_manager.write_item_data(fields['json_name'], fields['data'])
+            return new_item
         else:
             self._app.log_error('Could not find name for %s' % path)
+            return None
+
+    def _remove_tree_item(self, item):
+        self._thumb_scheduler.cancel([item.get_key()])
+        self._model.remove_item(item)
+
+    def _group_added(self, index):
+        self._tree_view.expand(index)
 
     def _setup_ui(self):
         self.setWindowTitle('Flipbook')
@@ -431,20 +694,33 @@ class AppDialog(QtGui.QWidget):
         refresh_but.setIcon(icon)
         refresh_but.clicked.connect(self._refresh_treewidget)
 
+        self._progress_bar = QtGui.QProgressBar()
+        self._progress_bar.setFixedWidth(120)
+        self._progress_bar.setTextVisible(False)
+        self._progress_bar.hide()
+
         upper_bar.addWidget(title_lab)
+        upper_bar.addWidget(self._progress_bar)
         upper_bar.addWidget(refresh_but)
 
         #Tree layout
-        self._tree_widget = QtGui.QTreeWidget()
-        self._tree_widget.itemClicked.connect(self._set_flipbook_name_sel)
-
-        self._tree_widget.setColumnCount(len(self._column_names.get_nice_names()))
-        self._tree_widget.setHeaderLabels(self._column_names.get_nice_names())
-        self._tree_widget.setSelectionMode(QtGui.QAbstractItemView.SelectionMode.ExtendedSelection)
-        self._tree_widget.header().setSectionsMovable(False)
-        self._tree_widget.header().resizeSections(QtGui.QHeaderView.ResizeToContents)
-        self._tree_widget.itemDoubleClicked.connect(self._item_double_clicked)
-        self._tree_widget.itemExpanded.connect(self._item_expanded)
+        self._model = flipbookmodel.FlipbookModel(self._catalog, self._column_names, self)
+        self._model.group_added.connect(self._group_added)
+        self._thumb_delegate = flipbookmodel.ThumbnailDelegate(self)
+
+        self._tree_view = QtGui.QTreeView()
+        self._tree_view.setModel(self._model)
+        self._tree_view.setItemDelegateForColumn(self._column_names.index_name('thumb'), self._thumb_delegate)
+        self._tree_view.clicked.connect(self._set_flipbook_name_sel)
+
+        self._tree_view.setSelectionMode(QtGui.QAbstractItemView.SelectionMode.ExtendedSelection)
+        self._tree_view.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self._tree_view.header().setSectionsMovable(False)
+        self._tree_view.header().resizeSections(QtGui.QHeaderView.ResizeToContents)
+        self._tree_view.doubleClicked.connect(self._item_double_clicked)
+        self._tree_view.expanded.connect(self._item_expanded)
+        self._tree_view.collapsed.connect(self._item_collapsed)
+        self._tree_view.verticalScrollBar().valueChanged.connect(self._tree_scrolled)
 
         tree_bar = QtGui.QHBoxLayout()
         del_but = QtGui.QPushButton('Delete')
@@ -455,11 +731,23 @@ class AppDialog(QtGui.QWidget):
         send_but.clicked.connect(self._copy_flipbook_clipboard)
         publish_but = QtGui.QPushButton('Publish')
         publish_but.clicked.connect(self._publish_flipbook)
+        self._cancel_publish_but = QtGui.QPushButton('Cancel Publish')
+        self._cancel_publish_but.clicked.connect(self._cancel_publish)
+        self._cancel_publish_but.hide()
+        perf_but = QtGui.QPushButton('Performance')
+        perf_but.setCheckable(True)
 
         tree_bar.addWidget(del_but)
         tree_bar.addWidget(load_but)
         tree_bar.addWidget(send_but)
         tree_bar.addWidget(publish_but)
+        tree_bar.addWidget(self._cancel_publish_but)
+        tree_bar.addWidget(perf_but)
+
+        #Performance view
+        self._perf_view = perfview.PerfView(self)
+        self._perf_view.hide()
+        perf_but.toggled.connect(self._perf_view.setVisible)
 
         #New flipbook layout
         new_flipbook_bar = QtGui.QVBoxLayout()
@@ -530,20 +818,32 @@ class AppDialog(QtGui.QWidget):
         #Create final layout
         self.setLayout(QtGui.QVBoxLayout())
         self.layout().addLayout(upper_bar)
-        self.layout().addWidget(self._tree_widget)
+        self.layout().addWidget(self._tree_view)
         self.layout().addLayout(tree_bar)
+        self.layout().addWidget(self._perf_view)
         self.layout().addLayout(new_flipbook_bar)
 
     def _tree_find_selected(self):
         items = []
-        for top_level in range(self._tree_widget.topLevelItemCount()):
-            top_level_widget = self._tree_widget.topLevelItem(top_level)
-            top_level_widget.setSelected(False)
-
-            for index in range(top_level_widget.childCount()):
-                if top_level_widget.child(index).isSelected():
-                    items.append(top_level_widget.child(index))
-                    top_level_widget.child(index).setSelected(False)
+        for index in self._tree_view.selectionModel().selectedRows():
+            node = self._model.node_from_index(index)
+            if isinstance(node, treeitem.TreeItem):
+                items.append(node)
+
+        self._tree_view.clearSelection()
+        return items
+
+    def _visible_items(self):
+        # walk down from the first row in the viewport to its bottom
+        items = []
+        viewport_height = self._tree_view.viewport().height()
+        index = self._tree_view.indexAt(QtCore.QPoint(0, 0))
+
+        while index.isValid() and self._tree_view.visualRect(index).top() < viewport_height:
+            node = self._model.node_from_index(index)
+            if isinstance(node, treeitem.TreeItem):
+                items.append(node)
+            index = self._tree_view.indexBelow(index)
         return items
 
     # extract fields from current Houdini file using the workfile template
@@ -561,6 +861,21 @@ class AppDialog(QtGui.QWidget):
     ###################################################################################################
     # public functions
 
+    def get_thumbnail_store(self):
+        return self._thumb_store
+
+    def write_item_data(self, item):
+        fields = item.get_fields()
+        self._json_manager.write_item_data(fields['json_name'], fields['data'])
+
+    def item_changed(self, item, thumbnail=False):
+        if thumbnail:
+            self._thumb_delegate.forget(item)
+        self._model.item_changed(item)
+
+    def get_thumbnail_scheduler(self):
+        return self._thumb_scheduler
+
     def get_ffmpeg_exec(self):
         if not hasattr(self, '_ffmpeg_exec'):
             self._ffmpeg_exec = self._app.get_setting("ffmpeg_executable")
@@ -570,6 +885,23 @@ class AppDialog(QtGui.QWidget):
        
         return self._ffmpeg_exec
 
+    def closeEvent(self, event):
+        # stop the background scans before the widget goes away
+        for worker in self._scan_workers:
+            worker.cancel()
+            worker.wait()
+        self._thumb_scheduler.cancel_all()
+        self._watcher.stop()
+        self._render_monitor.stop()
+        if self._publish_queue:
+            self._publish_queue.stop()
+        if self._dependency_scanner:
+            self._dependency_scanner.stop()
+        if self._prefetcher:
+            self._prefetcher.cancel()
+
+        super(AppDialog, self).closeEvent(event)
+
     ###################################################################################################
     # navigation
 
@@ -580,10 +912,34 @@ class AppDialog(QtGui.QWidget):
         :param context: The context to navigate to.
         """
 
-        self._app.log_error('Navigated to dialog!')
-        self._json_manager = jsonmanager.JsonManager(self._app, self._output_template, self._get_hipfile_name())
-        
-        # remove whole tree
-        self._tree_widget.clear()
+        self._app.log_debug('Navigating the flipbook panel to %s' % context)
+        self._thumb_scheduler.cancel_all()
+
+        # the versions still being written get their range from disk, so
+        # their row doesn't keep the progress when the context is shown again
+        for render in self._render_monitor.get_renders():
+            self._render_finished(render)
+        self._render_monitor.stop()
+        if self._prefetcher:
+            self._prefetcher.cancel()
+
+        # drop the results of a refresh of the context left
+        self._refresh_generation += 1
+        if self._scan_worker:
+            self._scan_worker.cancel()
+            self._scan_worker = None
+
+        # keep the state of the context left, and reuse the state of a
+        # context shown recently instead of loading it again
+        if not self._first_load_pending:
+            self._save_context_state()
+
+        if not self._restore_context_state(self._get_context_key()):
+            self._catalog = catalog.FlipbookCatalog()
+            self._create_stores()
+            self._load_metadata()
+
+        self._model.set_catalog(self._catalog)
 
+        # the refresh only lists the directories whose mtime changed
         self._refresh_treewidget()
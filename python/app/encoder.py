@@ -0,0 +1,88 @@
+import os
+import sys
+import subprocess
+import threading
+import multiprocessing
+
+def default_max_jobs():
+    # every encoder process already uses several threads, running as many
+    # encodes as there are cores only makes them compete
+    return max(1, min(4, multiprocessing.cpu_count() // 2))
+
+class NozmovEncoder():
+    """
+    Encodes preview movies with the tk-multi-nozmov app and its preset.
+
+    The nozmov app keeps the movie to encode as state between noz_movie()
+    and execute(), so encodes going through the app can't overlap and are
+    run one at a time.
+    """
+    # encodes this encoder can run at the same time
+    max_jobs = 1
+
+    def __init__(self, nozmov_app, app, preset):
+        self._nozmov_app = nozmov_app
+        self._app = app
+        self._preset = preset
+        self._lock = threading.Lock()
+
+    def output_path(self, frames_path):
+        return self._nozmov_app.calc_output_filepath(frames_path, self._preset)
+
+    def encode(self, job):
+        data = job.fields['data']
+
+        with self._lock:
+            self._nozmov_app.noz_movie(in_file = job.frames_path,
+                                       out_file = job.preview_movie_path,
+                                       first_frame = data['first_frame'],
+                                       last_frame = data['last_frame'],
+                                       framerate = job.fps,
+                                       preset_name = self._preset,
+                                       user_name = self._app.context.user['name'],
+                                       version_info = job.version_info,
+                                       publish_hook=self._app)
+            # Create the movie file
+            self._nozmov_app.execute()
+
+class FFmpegEncoder():
+    """
+    Encodes preview movies by running ffmpeg directly, used when the nozmov
+    app isn't available. Every encode is its own ffmpeg process so any
+    number of them can run at the same time. There is no slate or burn-in.
+    """
+    # no limit other than the encode_max_jobs setting
+    max_jobs = None
+
+    def __init__(self, ffmpeg_exec):
+        self._ffmpeg_exec = ffmpeg_exec
+
+    def output_path(self, frames_path):
+        # next to the frames, without a number the scanner would take for a frame
+        head = os.path.basename(frames_path).split('####')[0].rstrip('._')
+        return os.path.join(os.path.dirname(frames_path), '%s_preview.mov' % head)
+
+    def command(self, job):
+        data = job.fields['data']
+        return [self._ffmpeg_exec,
+                '-y',
+                '-framerate', str(job.fps),
+                '-start_number', str(data['first_frame']),
+                '-i', job.frames_path.replace('####', '%04d'),
+                '-frames:v', str(data['last_frame'] - data['first_frame'] + 1),
+                '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+                '-c:v', 'libx264',
+                '-pix_fmt', 'yuv420p',
+                '-crf', '18',
+                job.preview_movie_path]
+
+    def encode(self, job):
+        startupinfo = None
+        if sys.platform == 'win32':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        process = subprocess.Popen(self.command(job), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, startupinfo=startupinfo)
+        output = process.communicate()[0]
+        if process.returncode != 0:
+            raise Exception("ffmpeg failed to encode %s: %s" % (job.preview_movie_path, output.decode('utf-8', 'replace')[-500:]))
@@ -0,0 +1,324 @@
+from sgtk.platform.qt import QtCore, QtGui
+
+import os
+import bisect
+from collections import OrderedDict
+
+from . import catalog, helpers, thumbbackend, thumbscheduler, treeitem
+
+# number of rows added to the view at a time
+FETCH_SIZE = 100
+
+# number of thumbnails kept decoded by the delegate
+THUMBNAIL_CACHE_SIZE = 300
+
+class FlipbookModel(QtCore.QAbstractItemModel):
+    """
+    Two level model of the flipbooks of the current file, flipbook names on
+    the top level and their versions below. It is a view on a
+    FlipbookCatalog, only the first fetched versions of a node are rows of
+    the model, the others are added lazily through canFetchMore/fetchMore.
+    """
+    # emitted with the index of every group that becomes a row, whether
+    # it was added or fetched, so the view can expand it
+    group_added = QtCore.Signal(object)
+
+    def __init__(self, flipbook_catalog, column_names, parent=None):
+        super(FlipbookModel, self).__init__(parent)
+        self._catalog = flipbook_catalog
+        self._column_names = column_names
+        self._fetched = {}
+        self._groups_fetched = 0
+
+        resources = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "resources"))
+        self._published_icon = QtGui.QIcon(os.path.join(resources, "check.svg"))
+        self._unpublished_icon = QtGui.QIcon(os.path.join(resources, "cross.svg"))
+
+    ###################################################################################################
+    # QAbstractItemModel
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+
+        if not parent.isValid():
+            return self.createIndex(row, column, self._catalog.node_at(row))
+
+        group = parent.internalPointer()
+        return self.createIndex(row, column, group.items[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+
+        node = index.internalPointer()
+        if isinstance(node, catalog.CatalogNode):
+            return QtCore.QModelIndex()
+
+        group, row = self._catalog.locate(node.get_path())
+        return self.createIndex(self._catalog.node_row(group), 0, group)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return self._groups_fetched
+
+        node = parent.internalPointer()
+        if isinstance(node, catalog.CatalogNode):
+            return self._fetched.get(node.name, 0)
+        return 0
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self._column_names.get_nice_names())
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return bool(len(self._catalog))
+
+        node = parent.internalPointer()
+        return isinstance(node, catalog.CatalogNode) and bool(node.items)
+
+    def canFetchMore(self, parent):
+        if not parent.isValid():
+            return self._groups_fetched < len(self._fetched)
+
+        node = parent.internalPointer()
+        return isinstance(node, catalog.CatalogNode) and self._fetched.get(node.name, 0) < len(node.items)
+
+    def fetchMore(self, parent):
+        if not parent.isValid():
+            count = min(FETCH_SIZE, len(self._fetched) - self._groups_fetched)
+            if count > 0:
+                first = self._groups_fetched
+                self.beginInsertRows(parent, first, first + count - 1)
+                self._groups_fetched += count
+                self.endInsertRows()
+
+                for row in range(first, first + count):
+                    self.group_added.emit(self.createIndex(row, 0, self._catalog.node_at(row)))
+            return
+
+        group = parent.internalPointer()
+        fetched = self._fetched[group.name]
+        count = min(FETCH_SIZE, len(group.items) - fetched)
+        if count > 0:
+            self.beginInsertRows(parent, fetched, fetched + count - 1)
+            self._fetched[group.name] += count
+            self.endInsertRows()
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self._column_names.get_nice_names()[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        node = index.internalPointer()
+        column = index.column()
+
+        if isinstance(node, catalog.CatalogNode):
+            if role == QtCore.Qt.DisplayRole:
+                if column == self._column_names.index_name('name'):
+                    return node.name
+                elif column == self._column_names.index_name('size'):
+                    # total of all versions, fetched or not
+                    return helpers.format_size(sum(item.get_size() or 0 for item in node.items))
+            return None
+
+        if role == QtCore.Qt.DisplayRole:
+            if column == self._column_names.index_name('name'):
+                return node.get_label()
+            elif column == self._column_names.index_name('range'):
+                return node.get_range()
+            elif column == self._column_names.index_name('size'):
+                return helpers.format_size(node.get_size())
+            elif column == self._column_names.index_name('comment'):
+                return node.get_comment()
+            elif column == self._column_names.index_name('publish'):
+                return node.get_publish_status()
+        elif role == QtCore.Qt.DecorationRole and column == self._column_names.index_name('publish'):
+            return self._published_icon if node.is_published() else self._unpublished_icon
+        elif role == QtCore.Qt.ToolTipRole:
+            if column == self._column_names.index_name('publish') and node.get_publish_error():
+                return node.get_publish_error()
+            if column == self._column_names.index_name('size'):
+                return '%s frames' % node.get_frame_count()
+            return node.get_path()
+        return None
+
+    ###################################################################################################
+    # Public methods
+
+    def add_item(self, item):
+        fields = item.get_fields()
+        name = fields['node']
+
+        group = self._catalog.get_node(name)
+        if not group:
+            # show the new group right away if it lands among the groups
+            # shown or if all groups are shown
+            group_row = self._catalog.node_insert_row(name)
+            shown = group_row < self._groups_fetched or self._groups_fetched == len(self._fetched)
+            if shown:
+                self.beginInsertRows(QtCore.QModelIndex(), group_row, group_row)
+            group, row, new_group = self._catalog.add(name, fields['version'], item.get_path(), item)
+            self._fetched[name] = 0
+            if shown:
+                self._groups_fetched += 1
+                self.endInsertRows()
+                self.group_added.emit(self.group_index(group))
+
+                self.beginInsertRows(self.group_index(group), row, row)
+                self._fetched[name] += 1
+                self.endInsertRows()
+            return
+
+        # rows past the fetched ones stay hidden until they are fetched,
+        # except for versions added at the end of a fully fetched group
+        group_index = self.group_index(group)
+        fetched = self._fetched[name]
+        all_fetched = fetched == len(group.items)
+        row = bisect.bisect_right(group.versions, fields['version'])
+        if group_index.isValid() and (row < fetched or all_fetched):
+            self.beginInsertRows(group_index, row, row)
+            self._catalog.add(name, fields['version'], item.get_path(), item)
+            self._fetched[name] += 1
+            self.endInsertRows()
+        else:
+            self._catalog.add(name, fields['version'], item.get_path(), item)
+
+    def remove_item(self, item):
+        group, row = self._catalog.locate(item.get_path())
+        if not group or row < 0:
+            return
+
+        group_row = self._catalog.node_row(group)
+        group_shown = group_row < self._groups_fetched
+        if len(group.items) == 1:
+            # the catalog drops the node along with its last version, so
+            # the whole group row goes
+            if group_shown:
+                self.beginRemoveRows(QtCore.QModelIndex(), group_row, group_row)
+            self._catalog.remove(item.get_path())
+            self._fetched.pop(group.name)
+            if group_shown:
+                self._groups_fetched -= 1
+                self.endRemoveRows()
+        elif group_shown and row < self._fetched[group.name]:
+            self.beginRemoveRows(self.createIndex(group_row, 0, group), row, row)
+            self._catalog.remove(item.get_path())
+            self._fetched[group.name] -= 1
+            self.endRemoveRows()
+        else:
+            self._catalog.remove(item.get_path())
+
+    def item_changed(self, item):
+        index = self.item_index(item)
+        if index.isValid():
+            last = self.index(index.row(), self.columnCount() - 1, index.parent())
+            self.dataChanged.emit(index, last)
+
+            # the size of the group is the total of its versions
+            size_index = self.index(index.parent().row(), self._column_names.index_name('size'))
+            self.dataChanged.emit(size_index, size_index)
+
+    def set_catalog(self, flipbook_catalog):
+        # rows of the new catalog are fetched again as the view needs them
+        self.beginResetModel()
+        self._catalog = flipbook_catalog
+        self._fetched = dict((node.name, 0) for node in flipbook_catalog.get_nodes())
+        self._groups_fetched = 0
+        self.endResetModel()
+
+    def group_index(self, group):
+        row = self._catalog.node_row(group)
+        if row < 0 or row >= self._groups_fetched:
+            return QtCore.QModelIndex()
+        return self.createIndex(row, 0, group)
+
+    def item_index(self, item, column=0):
+        group, row = self._catalog.locate(item.get_path())
+        if not group or row < 0 or row >= self._fetched[group.name] or not self.group_index(group).isValid():
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, item)
+
+    def node_from_index(self, index):
+        if not index.isValid():
+            return None
+        return index.internalPointer()
+
+class ThumbnailDelegate(QtGui.QStyledItemDelegate):
+    """
+    Paints the thumbnail of a version. Thumbnails are only decoded for the
+    rows that get painted and a bounded number of them is kept, missing
+    thumbnails are requested from the scheduler with the priority of
+    visible rows.
+    """
+    def __init__(self, parent=None):
+        super(ThumbnailDelegate, self).__init__(parent)
+        self._pixmaps = OrderedDict()
+        self._requested = []
+
+    def paint(self, painter, option, index):
+        super(ThumbnailDelegate, self).paint(painter, option, index)
+
+        item = index.internalPointer()
+        if not isinstance(item, treeitem.TreeItem):
+            return
+
+        pixmap = self._get_pixmap(item)
+        if pixmap is None:
+            self._request(item)
+            return
+
+        x = option.rect.x() + int((option.rect.width() - pixmap.width()) / 2)
+        y = option.rect.y() + int((option.rect.height() - pixmap.height()) / 2)
+        painter.drawPixmap(x, y, pixmap)
+
+    def sizeHint(self, option, index):
+        item = index.internalPointer()
+        if isinstance(item, treeitem.TreeItem):
+            pixmap = self._pixmaps.get(item.get_thumbnail_path())
+            height = pixmap.height() if pixmap is not None else int(thumbbackend.THUMBNAIL_WIDTH * 9 / 16)
+            return QtCore.QSize(thumbbackend.THUMBNAIL_WIDTH + 4, height + 2)
+        return super(ThumbnailDelegate, self).sizeHint(option, index)
+
+    def forget(self, item):
+        self._pixmaps.pop(item.get_thumbnail_path(), None)
+
+    def _get_pixmap(self, item):
+        thumb_path = item.get_thumbnail_path()
+        if not thumb_path:
+            return None
+
+        pixmap = self._pixmaps.pop(thumb_path, None)
+        if pixmap is None:
+            pixmap = QtGui.QPixmap(thumb_path)
+            if pixmap.isNull():
+                return None
+
+        # most recently painted last, drop the oldest
+        self._pixmaps[thumb_path] = pixmap
+        while len(self._pixmaps) > THUMBNAIL_CACHE_SIZE:
+            self._pixmaps.popitem(last=False)
+        return pixmap
+
+    def _request(self, item):
+        # start the jobs after painting
+        if not self._requested:
+            QtCore.QTimer.singleShot(0, self._start_requests)
+        self._requested.append(item)
+
+    def _start_requests(self):
+        requested = self._requested
+        self._requested = []
+        for item in requested:
+            item.load_thumbnail(thumbscheduler.ThumbnailScheduler.VISIBLE)
@@ -0,0 +1,65 @@
+import bisect
+
+class FrameSet():
+    """
+    Set of frame numbers kept as sorted runs of consecutive frames, so a
+    sequence without gaps takes a single run whatever its length.
+    """
+    def __init__(self, frames=None):
+        self._starts = []
+        self._ends = []
+        self._count = 0
+
+        for frame in frames or []:
+            self.add(frame)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, frame):
+        run = bisect.bisect_right(self._starts, frame) - 1
+        return run >= 0 and frame <= self._ends[run]
+
+    def add(self, frame):
+        if frame in self:
+            return
+
+        # the run after the frame, the one before ends before the frame
+        run = bisect.bisect_right(self._starts, frame)
+        joins_previous = run > 0 and self._ends[run - 1] == frame - 1
+        joins_next = run < len(self._starts) and self._starts[run] == frame + 1
+
+        if joins_previous and joins_next:
+            self._ends[run - 1] = self._ends[run]
+            del self._starts[run]
+            del self._ends[run]
+        elif joins_previous:
+            self._ends[run - 1] = frame
+        elif joins_next:
+            self._starts[run] = frame
+        else:
+            self._starts.insert(run, frame)
+            self._ends.insert(run, frame)
+        self._count += 1
+
+    def runs(self):
+        return list(zip(self._starts, self._ends))
+
+    def next_missing(self, frame):
+        """
+        Returns the first frame from frame on that isn't in the set.
+        """
+        run = bisect.bisect_right(self._starts, frame) - 1
+        if run >= 0 and frame <= self._ends[run]:
+            return self._ends[run] + 1
+        return frame
+
+    def missing(self, first_frame, last_frame):
+        frames = []
+        frame = self.next_missing(first_frame)
+        while frame <= last_frame:
+            run = bisect.bisect_right(self._starts, frame)
+            end = min(last_frame, self._starts[run] - 1) if run < len(self._starts) else last_frame
+            frames.extend(range(frame, end + 1))
+            frame = self.next_missing(end + 1)
+        return frames
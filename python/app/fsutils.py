@@ -0,0 +1,16 @@
+import os
+import sys
+
+def replace_file(src, dst):
+    # rename over an existing file, os.replace is missing on python 2
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if sys.platform == 'win32' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+def make_dirs(path):
+    # create dir if it doesn't exist
+    if not os.path.exists(path):
+        os.makedirs(path)
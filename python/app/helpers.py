@@ -7,10 +7,19 @@ class MessageBox(QtGui.QMessageBox):
         self.setText(message)
         self.show()
 
+def format_size(size):
+    if size is None:
+        return ''
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return '%.1f %s' % (size, unit) if unit != 'B' else '%d B' % size
+        size /= 1024.0
+    return '%.1f TB' % size
+
 class ColumnNames():
     def __init__(self):
-        self._nice_names = ['Flipbook Name', 'Thumbnail', 'Range', 'Published', 'Comment']
-        self._prog_names = ['name', 'thumb', 'range', 'publish', 'comment']
+        self._nice_names = ['Flipbook Name', 'Thumbnail', 'Range', 'Size', 'Published', 'Comment']
+        self._prog_names = ['name', 'thumb', 'range', 'size', 'publish', 'comment']
     def index_name(self, name):
         return self._prog_names.index(name)
     def name_to_nice(self, name):
@@ -1,46 +1,235 @@
 import os
+import copy
 import json
+import threading
+from contextlib import contextmanager
+
+from . import perf
+from .fsutils import make_dirs, replace_file
+
+# the journal is compacted once it holds this many records and at least
+# COMPACT_RATIO times as many records as there are live items
+COMPACT_MIN_RECORDS = 500
+COMPACT_RATIO = 2
 
 class JsonManager():
-    def __init__(self, app, output_template, name):
-        # retrieve root path
-        fields = { 
-            "name": name,
-            "SEQ": "FORMAT: $F"
-            }
+    """
+    Stores the metadata of all flipbook versions of a hip file.
 
-        fields.update(app.context.as_template_fields(output_template))
-        root_path = output_template.parent.parent.apply_fields(fields)
+    Every update is appended as a single json line to '<name>_data.jsonl'.
+    Loading replays the journal, later records replacing earlier ones, and
+    the journal is rewritten in the background once it grows past the
+    compaction threshold. With load=False the journal is only read by
+    load() or the first access to the data.
+    """
+    def __init__(self, app, output_template, name, load=True):
+        root_path = get_root_path(app, output_template, name)
 
         self._json_path = os.path.join(root_path, '{}_data.json'.format(name))
+        self._journal_path = os.path.join(root_path, '{}_data.jsonl'.format(name))
         self._data = {}
-        
-        if os.path.exists(self._json_path):
+
+        # names of the records changed since the last write and
+        # nesting depth of the open batches
+        self._dirty = set()
+        self._batch_depth = 0
+
+        # number of records in the journal on disk, lines appended while a
+        # compaction is running and the compaction thread itself
+        self._journal_records = 0
+        self._compact_tail = None
+        self._compactor = None
+        self._lock = threading.Lock()
+
+        self._loaded = False
+        if load:
+            self.load()
+
+    def load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+
+        if os.path.exists(self._journal_path):
+            self._replay_journal()
+        elif os.path.exists(self._json_path):
+            # convert the data of older versions of the app
             with open(self._json_path, 'r') as json_data:
                 self._data = json.load(json_data)
 
+            self._compact()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups all writes done inside the block into a single write of the
+        journal when the outermost batch exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
     def get_item_data(self, item_name):
+        # hand out a copy so changes made by the caller can be detected
+        # when the data is written back
+        self.load()
         if item_name in self._data.keys():
-            return self._data[item_name]
+            return copy.deepcopy(self._data[item_name])
         return {}
 
     def remove_item(self, item_name):
+        self.load()
         if item_name in self._data.keys():
             self._data.pop(item_name)
+            self._dirty.add(item_name)
 
-            self._write_json()
+            self._write_if_unbatched()
 
     def write_item_data(self, item_name, item_data):
-        self._data[item_name] = item_data
+        # unchanged records never trigger a write
+        self.load()
+        if self._data.get(item_name) == item_data:
+            return
+
+        self._data[item_name] = copy.deepcopy(item_data)
+        self._dirty.add(item_name)
+
+        self._write_if_unbatched()
+
+    def flush(self):
+        if not self._dirty:
+            return
+
+        lines = []
+        for item_name in sorted(self._dirty):
+            if item_name in self._data:
+                record = {'name': item_name, 'data': self._data[item_name]}
+            else:
+                record = {'name': item_name, 'removed': True}
+            lines.append(json.dumps(record) + '\n')
+
+        with perf.span('json_write', records=len(lines)):
+            self._append_journal(lines)
+        self._dirty.clear()
+
+        if self._needs_compaction():
+            self._compact_async()
+
+    def get_root_path(self):
+        return os.path.dirname(self._journal_path)
+
+    def get_journal_path(self):
+        return self._journal_path
+
+    def item_names(self):
+        self.load()
+        return list(self._data.keys())
+
+    def is_compacting(self):
+        compactor = self._compactor
+        return bool(compactor and compactor.is_alive())
+
+    def wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor:
+            compactor.join()
+
+    ###################################################################################################
+    # Private methods
+
+    def _write_if_unbatched(self):
+        if not self._batch_depth:
+            self.flush()
+
+    def _replay_journal(self):
+        records = 0
+        line = '\n'
+        with open(self._journal_path, 'r') as journal:
+            for line in journal:
+                # skip the partial line an interrupted session may have left
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if record.get('removed'):
+                    self._data.pop(record['name'], None)
+                else:
+                    self._data[record['name']] = record['data']
+                records += 1
+
+        self._journal_records = records
+
+        # terminate a partial last line so the next append starts clean
+        if not line.endswith('\n'):
+            self._append_journal(['\n'])
+            self._journal_records -= 1
+
+    def _append_journal(self, lines):
+        self._make_root_dir()
+
+        with self._lock:
+            with open(self._journal_path, 'a') as journal:
+                journal.write(''.join(lines))
+
+            self._journal_records += len(lines)
+            if self._compact_tail is not None:
+                self._compact_tail.extend(lines)
+
+    def _needs_compaction(self):
+        return (self._journal_records >= COMPACT_MIN_RECORDS and
+                self._journal_records >= COMPACT_RATIO * len(self._data))
+
+    def _compact_async(self):
+        if self._compactor and self._compactor.is_alive():
+            return
+
+        self._compactor = threading.Thread(target=self._compact)
+        self._compactor.daemon = True
+        self._compactor.start()
+
+    def _compact(self):
+        self._make_root_dir()
+
+        # records are replaced and never changed in place, so a shallow
+        # copy is a consistent snapshot
+        with self._lock:
+            snapshot = dict(self._data)
+            self._compact_tail = []
+
+        tmp_path = '{}.{}.tmp'.format(self._journal_path, os.getpid())
+        try:
+            with perf.span('json_compact', records=len(snapshot)), open(tmp_path, 'w') as journal:
+                for item_name in sorted(snapshot):
+                    journal.write(json.dumps({'name': item_name, 'data': snapshot[item_name]}) + '\n')
+
+                # add whatever was appended since the snapshot was taken and
+                # swap the files before anything else gets appended
+                with self._lock:
+                    journal.write(''.join(self._compact_tail))
+                    journal.close()
+                    replace_file(tmp_path, self._journal_path)
 
-        # create dir if it doesn't exist
-        dirdir = os.path.dirname(self._json_path)
-        if not os.path.exists(dirdir):
-            os.makedirs(dirdir)
+                    self._journal_records = len(snapshot) + len(self._compact_tail)
+                    self._compact_tail = None
+        finally:
+            self._compact_tail = None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
-        self._write_json()
+    def _make_root_dir(self):
+        make_dirs(os.path.dirname(self._journal_path))
 
-    def _write_json(self):
-        with open(self._json_path, 'w') as json_data:
-            json.dump(self._data, json_data, indent=4)
+def get_root_path(app, output_template, name):
+    # the flipbook root of a hip file in the current context
+    fields = {
+        "name": name,
+        "SEQ": "FORMAT: $F"
+        }
 
+    fields.update(app.context.as_template_fields(output_template))
+    return output_template.parent.parent.apply_fields(fields)
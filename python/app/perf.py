@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+import collections
+import logging.handlers
+
+from .fsutils import make_dirs
+
+# number of spans kept in memory for the performance view
+RECENT_SPANS = 1000
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+class Span():
+    def __init__(self, name, start, duration, attrs):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs
+        self.thread = threading.current_thread().name
+
+    def to_dict(self):
+        return {'name': self.name, 'start': self.start, 'duration': self.duration,
+                'thread': self.thread, 'attrs': self.attrs}
+
+class PerfLog():
+    """
+    Timing records of the expensive operations of the panel. The last
+    spans are kept in memory for the performance view, and every span is
+    written as a json line to a rotating log once a log file is set.
+    Spans can be recorded from any thread.
+    """
+    def __init__(self, recent=RECENT_SPANS):
+        self._recent = collections.deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._logger = None
+        self._handler = None
+
+    ###################################################################################################
+    # Public methods
+
+    def set_log_file(self, log_path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        """
+        Writes the spans to log_path from now on, None stops writing them.
+        """
+        with self._lock:
+            if self._handler:
+                self._logger.removeHandler(self._handler)
+                self._handler.close()
+                self._logger = self._handler = None
+
+            if log_path:
+                make_dirs(os.path.dirname(log_path))
+                self._handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count)
+                self._handler.setFormatter(logging.Formatter('%(message)s'))
+
+                self._logger = logging.getLogger('tk-houdini-flipbook.perf')
+                self._logger.propagate = False
+                self._logger.setLevel(logging.INFO)
+                self._logger.addHandler(self._handler)
+
+    def record(self, name, start, duration, **attrs):
+        span = Span(name, start, duration, attrs)
+        with self._lock:
+            self._recent.append(span)
+            if self._logger:
+                self._logger.info(json.dumps(span.to_dict()))
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """
+        Times the block it wraps, attrs are stored with the span and can
+        be added to from inside the block.
+        """
+        start = time.time()
+        try:
+            yield attrs
+        finally:
+            self.record(name, start, time.time() - start, **attrs)
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    def summary(self):
+        """
+        Returns {name: (count, total, max)} of the durations of the spans
+        in memory.
+        """
+        totals = {}
+        for span in self.recent():
+            count, total, longest = totals.get(span.name, (0, 0.0, 0.0))
+            totals[span.name] = (count + 1, total + span.duration, max(longest, span.duration))
+        return totals
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+
+# spans of the whole app
+_perf_log = PerfLog()
+
+def get_log():
+    return _perf_log
+
+def span(name, **attrs):
+    return _perf_log.span(name, **attrs)
+
+def record(name, start, duration, **attrs):
+    return _perf_log.record(name, start, duration, **attrs)
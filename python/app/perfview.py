@@ -0,0 +1,70 @@
+from sgtk.platform.qt import QtCore, QtGui
+
+import time
+
+from . import perf
+
+class PerfView(QtGui.QWidget):
+    """
+    Shows the timings of the last spans recorded, per span name, and the
+    slowest recent spans. Only updated while it is visible.
+    """
+    SLOWEST_SPANS = 20
+
+    def __init__(self, parent=None, interval=1000):
+        super(PerfView, self).__init__(parent)
+
+        self._summary_tree = QtGui.QTreeWidget()
+        self._summary_tree.setHeaderLabels(['Span', 'Count', 'Mean (ms)', 'Max (ms)', 'Total (s)'])
+        self._summary_tree.setRootIsDecorated(False)
+
+        self._slowest_tree = QtGui.QTreeWidget()
+        self._slowest_tree.setHeaderLabels(['Slowest', 'Time', 'Duration (ms)', 'Details'])
+        self._slowest_tree.setRootIsDecorated(False)
+
+        clear_but = QtGui.QPushButton('Clear')
+        clear_but.clicked.connect(self._clear)
+
+        self.setLayout(QtGui.QVBoxLayout())
+        self.layout().setContentsMargins(0, 0, 0, 0)
+        self.layout().addWidget(self._summary_tree)
+        self.layout().addWidget(self._slowest_tree)
+        self.layout().addWidget(clear_but)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._update)
+
+    ###################################################################################################
+    # Private methods
+
+    def _update(self):
+        perf_log = perf.get_log()
+
+        self._summary_tree.clear()
+        for name, (count, total, longest) in sorted(perf_log.summary().items()):
+            self._summary_tree.addTopLevelItem(QtGui.QTreeWidgetItem(
+                [name, str(count), '%.1f' % (total / count * 1000), '%.1f' % (longest * 1000), '%.2f' % total]))
+
+        self._slowest_tree.clear()
+        spans = sorted(perf_log.recent(), key=lambda span: span.duration, reverse=True)
+        for span in spans[:PerfView.SLOWEST_SPANS]:
+            details = ', '.join('%s=%s' % (key, value) for key, value in sorted(span.attrs.items()))
+            self._slowest_tree.addTopLevelItem(QtGui.QTreeWidgetItem(
+                [span.name, time.strftime('%H:%M:%S', time.localtime(span.start)), '%.1f' % (span.duration * 1000), details]))
+
+    def _clear(self):
+        perf.get_log().clear()
+        self._update()
+
+    ###################################################################################################
+    # QWidget
+
+    def showEvent(self, event):
+        self._update()
+        self._timer.start()
+        super(PerfView, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self._timer.stop()
+        super(PerfView, self).hideEvent(event)
@@ -0,0 +1,96 @@
+import os
+import threading
+
+# size of the reads warming the cache where posix_fadvise is missing
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+class _PrefetchRun():
+    def __init__(self, paths, budget):
+        self.paths = iter(paths)
+        self.budget = budget
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+
+    def next_path(self):
+        with self.lock:
+            if self.cancelled.is_set():
+                return None
+            return next(self.paths, None)
+
+    def reserve(self, size):
+        # takes a frame out of the budget, the run stops at the first frame
+        # that doesn't fit
+        with self.lock:
+            if size > self.budget:
+                self.cancelled.set()
+                return False
+            self.budget -= size
+            return True
+
+class Prefetcher():
+    """
+    Warms the page cache with the frames of the sequences about to be
+    played, so the first loop doesn't wait on the network storage.
+
+    Frames are fetched in order by max_threads threads at a time. Where
+    posix_fadvise is available the kernel is asked to read them ahead,
+    elsewhere they are read and thrown away. Fetching stops once
+    budget bytes were fetched or when cancelled.
+    """
+    def __init__(self, max_threads=8, budget=2048 * 1024 * 1024):
+        self._max_threads = max(1, max_threads)
+        self._budget = budget
+        self._run = None
+
+    ###################################################################################################
+    # Private methods
+
+    def _fetch(self, path, run):
+        # the size is taken from the open file, outside the lock of the run,
+        # so the threads don't wait on each other's stats
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            if not run.reserve(os.fstat(fd).st_size):
+                return
+
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                return
+
+            while not run.cancelled.is_set() and os.read(fd, READ_CHUNK_SIZE):
+                pass
+        finally:
+            os.close(fd)
+
+    def _work(self, run):
+        while not run.cancelled.is_set():
+            path = run.next_path()
+            if path is None:
+                return
+
+            try:
+                self._fetch(path, run)
+            except OSError:
+                pass
+
+    ###################################################################################################
+    # Public methods
+
+    def prefetch(self, paths):
+        """
+        Starts fetching the frame paths in the background, a prefetch that
+        is still running is cancelled.
+        """
+        self.cancel()
+
+        run = _PrefetchRun(paths, self._budget)
+        for index in range(self._max_threads):
+            thread = threading.Thread(target=self._work, args=(run,))
+            thread.daemon = True
+            thread.start()
+        self._run = run
+
+    def cancel(self):
+        if self._run:
+            self._run.cancelled.set()
+            self._run = None
@@ -0,0 +1,391 @@
+from sgtk.platform.qt import QtCore
+
+import sgtk
+import threading
+
+from . import perf, uploader
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# attempts of the steps that talk to ShotGrid and the delay before the
+# first retry, doubled after every failed attempt
+RETRY_ATTEMPTS = 4
+RETRY_DELAY = 1.0
+
+class PublishCancelled(Exception):
+    pass
+
+class PublishJob():
+    """
+    Publish of one flipbook version. Everything needed from Houdini is
+    gathered on the main thread when the job is created, the stages only
+    add their results to it.
+
+    version is the ShotGrid Version created by an earlier publish of the
+    flipbook that failed after creating it, it is updated instead of
+    creating another one.
+    """
+    (QUEUED, REGISTERING, ENCODING, CREATING, UPLOADING, DONE, FAILED, CANCELLED) = range(8)
+
+    STATUS_NAMES = ['Queued', 'Registering', 'Encoding', 'Creating version', 'Uploading', 'Published', 'Failed', 'Cancelled']
+
+    def __init__(self, key, fields, frames_path, backup_hip_path, dependency_paths, fps, version_info, version=None):
+        self.key = key
+        self.fields = fields
+        self.frames_path = frames_path
+        self.backup_hip_path = backup_hip_path
+        self.dependency_paths = dependency_paths
+        self.fps = fps
+        self.version_info = version_info
+
+        self.status = PublishJob.QUEUED
+        self.error = None
+        self.progress = None
+        self._cancelled = threading.Event()
+
+        # results of the stages
+        self.published_file = None
+        self.preview_movie_path = None
+        self.version = version
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait_cancelled(self, timeout):
+        # sleeps for timeout seconds unless the job gets cancelled meanwhile
+        self._cancelled.wait(timeout)
+        return self._cancelled.is_set()
+
+    def is_finished(self):
+        return PublishJob.is_final(self.status)
+
+    def status_name(self):
+        return PublishJob.describe(self.status, self.progress)
+
+    @staticmethod
+    def is_final(status):
+        return status in (PublishJob.DONE, PublishJob.FAILED, PublishJob.CANCELLED)
+
+    @staticmethod
+    def describe(status, progress=None):
+        if status == PublishJob.UPLOADING and progress is not None:
+            return '%s %d%%' % (PublishJob.STATUS_NAMES[status], progress)
+        return PublishJob.STATUS_NAMES[status]
+
+class PublishQueue(QtCore.QObject):
+    """
+    Publishes flipbooks in the background. Every stage of a publish runs on
+    its own thread and hands the jobs over to the next one, so one flipbook
+    can be encoded while the previous one uploads.
+
+    The flipbooks submitted together are registered and get their versions
+    created together, with a single ShotGrid batch request for all the
+    versions, before they are encoded and uploaded one by one. Up to
+    encode_jobs movies are encoded and upload_jobs movies are uploaded at
+    the same time.
+
+    job_changed is emitted with the key, status, error, upload progress and
+    ShotGrid Version of a job whenever its status changes. The values are
+    taken when the signal is emitted, a slot on the main thread may run
+    after the job changed again. The ShotGrid connection of toolkit is
+    local to each thread, so the stages don't share one.
+    """
+    job_changed = QtCore.Signal(str, int, object, object, object)
+
+    def __init__(self, app, encoder, encode_jobs=1, upload_jobs=2, parent=None):
+        super(PublishQueue, self).__init__(parent)
+        self._app = app
+        self._encoder = encoder
+        self._uploader = uploader.ChunkedUploader()
+
+        # (status, function, batched, threads), a batched stage gets all
+        # the jobs waiting for it at once, returns the errors by job key and
+        # hands the jobs over to the next stage together
+        self._stages = [
+            (PublishJob.REGISTERING, self._register, True, 1),
+            (PublishJob.CREATING, self._create_versions, True, 1),
+            (PublishJob.ENCODING, self._encode, False, max(1, encode_jobs)),
+            (PublishJob.UPLOADING, self._upload, False, max(1, upload_jobs))
+            ]
+
+        self._jobs = {}
+        self._queues = [queue.Queue() for stage in self._stages]
+        self._threads = []
+
+    ###################################################################################################
+    # Stages
+
+    def _register(self, jobs):
+        # register_publish does several requests of its own and can't be
+        # batched, the jobs are only kept together for the next stage
+        errors = {}
+        for job in jobs:
+            try:
+                self._register_job(job)
+            except Exception as e:
+                errors[job.key] = e
+        return errors
+
+    def _register_job(self, job):
+        fields = job.fields
+
+        # publish backup hip and sequence
+        sgtk.util.register_publish(self._app.sgtk, self._app.context, job.backup_hip_path, fields['node'],
+                                   published_file_type="Backup File", version_number=fields['version'],
+                                   dependency_paths=job.dependency_paths)
+
+        job.published_file = sgtk.util.register_publish(self._app.sgtk, self._app.context, job.frames_path, fields['node'],
+                                                        published_file_type="Playblast", version_number=fields['version'],
+                                                        dependency_paths=[job.backup_hip_path])
+
+        self._app.log_debug("Published backup file and flipbook for %s" % fields['node'])
+
+    def _encode(self, job):
+        self._encoder.encode(job)
+
+    def _create_versions(self, jobs):
+        # the versions are created before their movie is encoded so they
+        # can all be created with a single request
+        for job in jobs:
+            job.preview_movie_path = self._encoder.output_path(job.frames_path)
+
+        # Create the versions in Shotgun, the versions left by a failed
+        # publish are updated instead
+        requests = [self._version_request(job) for job in jobs]
+        try:
+            versions = self._app.shotgun.batch(requests)
+        except Exception as e:
+            if len(jobs) == 1 and not jobs[0].version:
+                return {jobs[0].key: e}
+
+            # a batch fails as a whole, create the versions one by one to
+            # find out which of them failed
+            self._app.log_warning("Failed to create %d versions at once, creating them one by one: %s" % (len(jobs), e))
+            errors = {}
+            for job in jobs:
+                try:
+                    job.version = self._create_version(job)
+                except Exception as e:
+                    errors[job.key] = e
+            return errors
+
+        for job, version in zip(jobs, versions):
+            job.version = {"type": "Version", "id": version["id"]}
+        return {}
+
+    def _version_request(self, job):
+        if job.version:
+            return {"request_type": "update", "entity_type": "Version", "entity_id": job.version["id"], "data": self._version_data(job)}
+        return {"request_type": "create", "entity_type": "Version", "data": self._version_data(job)}
+
+    def _create_version(self, job):
+        if job.version:
+            try:
+                self._app.shotgun.update("Version", job.version["id"], self._version_data(job))
+                return job.version
+            except Exception as e:
+                # the version may have been deleted since
+                self._app.log_warning("Could not update version %s of %s, creating a new one: %s" % (job.version["id"], job.key, e))
+
+        version = self._app.shotgun.create("Version", self._version_data(job))
+        return {"type": "Version", "id": version["id"]}
+
+    def _version_data(self, job):
+        data = job.fields['data']
+        return {
+            "code": job.version_info,
+            "sg_status_list": "rev",
+            "entity": self._app.context.entity,
+            "sg_task": self._app.context.task,
+            "sg_first_frame": data['first_frame'],
+            "sg_last_frame": data['last_frame'],
+            "frame_count": (data['last_frame'] - data['first_frame'] + 1),
+            "frame_range": "%s-%s" % (data['first_frame'], data['last_frame']),
+            "sg_frames_have_slate": False,
+            "created_by": self._app.context.user,
+            "updated_by": self._app.context.user,
+            "user": self._app.context.user,
+            "description": data.get('comment'),
+            "sg_path_to_frames": job.frames_path,
+            "sg_movie_has_slate": False,
+            "project": self._app.context.project,
+            "sg_path_to_movie": job.preview_movie_path,
+            "published_files": [job.published_file],
+            }
+
+    def _upload(self, job):
+        def progress(sent, size):
+            percent = int(100 * sent / size) if size else 100
+            if percent != job.progress:
+                job.progress = percent
+                self._emit_changed(job)
+
+        # the version isn't always ready for an upload right after its
+        # creation, retry instead of waiting a fixed time. The parts of a
+        # chunked upload already sent aren't sent again.
+        self._retry(job, self._uploader.upload, self._app.shotgun, "Version", job.version["id"], job.preview_movie_path,
+                    "sg_uploaded_movie", progress, job.is_cancelled)
+
+    ###################################################################################################
+    # Private methods
+
+    def _retry(self, job, function, *args):
+        delay = RETRY_DELAY
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                return function(*args)
+            except Exception as e:
+                if job.is_cancelled():
+                    raise PublishCancelled()
+                if attempt == RETRY_ATTEMPTS - 1:
+                    raise
+
+                self._app.log_warning("Attempt %d of %d failed for %s, retrying in %ss: %s" % (attempt + 1, RETRY_ATTEMPTS, job.key, delay, e))
+                if job.wait_cancelled(delay):
+                    raise PublishCancelled()
+                delay *= 2
+
+    def _set_status(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        self._emit_changed(job)
+
+    def _emit_changed(self, job):
+        self.job_changed.emit(job.key, job.status, job.error, job.progress, job.version)
+
+    def _next_jobs(self, stage_index, batched):
+        # waits for the next jobs, a batched stage also takes all the jobs
+        # queued behind them. None stops the stage.
+        jobs = self._queues[stage_index].get()
+        while batched and jobs is not None:
+            try:
+                more_jobs = self._queues[stage_index].get_nowait()
+            except queue.Empty:
+                break
+
+            if more_jobs is None:
+                self._queues[stage_index].put(None)
+                break
+            jobs = jobs + more_jobs
+        return jobs
+
+    def _run_stage(self, stage_index):
+        status, function, batched, threads = self._stages[stage_index]
+        while True:
+            jobs = self._next_jobs(stage_index, batched)
+            if jobs is None:
+                return
+
+            started = []
+            for job in jobs:
+                if job.is_cancelled():
+                    self._set_status(job, PublishJob.CANCELLED)
+                else:
+                    self._set_status(job, status)
+                    started.append(job)
+
+            stage_name = PublishJob.STATUS_NAMES[status]
+            if batched:
+                with perf.span('publish_stage', stage=stage_name, jobs=len(started)):
+                    errors = function(started) if started else {}
+                self._forward(stage_index, [job for job in started if not self._failed(job, errors.get(job.key))])
+            else:
+                for job in started:
+                    try:
+                        with perf.span('publish_stage', stage=stage_name, jobs=1, version=job.key):
+                            function(job)
+                    except Exception as e:
+                        self._failed(job, e)
+                    else:
+                        self._forward(stage_index, [job])
+
+    def _failed(self, job, error):
+        if isinstance(error, PublishCancelled):
+            self._set_status(job, PublishJob.CANCELLED)
+        elif error:
+            self._app.log_error("Failed to publish %s: %s" % (job.key, error))
+            self._set_status(job, PublishJob.FAILED, str(error))
+        return bool(error)
+
+    def _forward(self, stage_index, jobs):
+        if not jobs:
+            return
+
+        if stage_index + 1 < len(self._stages):
+            # the threads of a stage that isn't batched take the jobs one by one
+            if self._stages[stage_index + 1][2]:
+                self._queues[stage_index + 1].put(jobs)
+            else:
+                for job in jobs:
+                    self._queues[stage_index + 1].put([job])
+        else:
+            for job in jobs:
+                self._set_status(job, PublishJob.DONE)
+
+    def _start_threads(self):
+        if self._threads:
+            return
+
+        for stage_index, stage in enumerate(self._stages):
+            for index in range(stage[3]):
+                thread = threading.Thread(target=self._run_stage, args=(stage_index,))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    ###################################################################################################
+    # Public methods
+
+    def submit(self, jobs):
+        """
+        Queues the jobs of one publish, versions already queued or being
+        published are skipped. Returns the jobs queued.
+        """
+        queued = []
+        for job in jobs:
+            current = self._jobs.get(job.key)
+            if current and not current.is_finished():
+                continue
+
+            self._jobs[job.key] = job
+            self._set_status(job, PublishJob.QUEUED)
+            queued.append(job)
+
+        if queued:
+            self._start_threads()
+            self._queues[0].put(queued)
+        return queued
+
+    def cancel(self, keys):
+        """
+        Cancels the jobs of the given keys. A stage that already started
+        is finished, the job stops before the next one.
+        """
+        for key in keys:
+            job = self._jobs.get(key)
+            if job and not job.is_finished():
+                job.cancel()
+
+    def cancel_all(self):
+        self.cancel(list(self._jobs.keys()))
+
+    def is_busy(self):
+        return any(not job.is_finished() for job in self._jobs.values())
+
+    def stop(self):
+        """
+        Cancels all jobs and stops the stage threads once they finished
+        what they are running, without waiting for them. The queue can't
+        be used anymore afterwards.
+        """
+        self.cancel_all()
+        for job_queue, stage in zip(self._queues, self._stages):
+            for index in range(stage[3]):
+                job_queue.put(None)
+        self._threads = []
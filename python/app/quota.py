@@ -0,0 +1,53 @@
+# orders in which unpublished versions are evicted
+OLDEST = 'oldest'
+LEAST_VIEWED = 'viewed'
+
+class QuotaPolicy():
+    """
+    Picks the unpublished versions to delete so the flipbooks of a file
+    fit in max_bytes. Versions are evicted oldest first, or least recently
+    viewed first, versions that were never viewed count as viewed when
+    they were written. Published versions are never evicted, but their
+    size counts against the quota.
+    """
+    def __init__(self, max_bytes, order=OLDEST):
+        if order not in (OLDEST, LEAST_VIEWED):
+            raise ValueError("Unknown quota order '%s'" % order)
+
+        self._max_bytes = max_bytes
+        self._order = order
+
+    ###################################################################################################
+    # Private methods
+
+    def _age(self, item):
+        written = item.get_fields()['data'].get('scan', {}).get('dir_mtime') or 0
+        if self._order == LEAST_VIEWED:
+            return item.get_last_viewed() or written
+        return written
+
+    ###################################################################################################
+    # Public methods
+
+    def is_enabled(self):
+        return self._max_bytes > 0
+
+    def select(self, items, keep=()):
+        """
+        Returns the items to evict, in eviction order. The keys in keep are
+        never evicted, for example the versions being published.
+        """
+        if not self.is_enabled():
+            return []
+
+        total = sum(item.get_size() or 0 for item in items)
+        candidates = [item for item in items if not item.is_published() and item.get_key() not in keep]
+        candidates.sort(key=self._age)
+
+        evicted = []
+        for item in candidates:
+            if total <= self._max_bytes:
+                break
+            total -= item.get_size() or 0
+            evicted.append(item)
+        return evicted
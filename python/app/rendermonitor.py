@@ -0,0 +1,136 @@
+from sgtk.platform.qt import QtCore
+
+import os
+import time
+
+from . import scanner
+from .frameset import FrameSet
+
+class RenderProgress():
+    """
+    Frames of a version written so far out of its requested frame range.
+    """
+    def __init__(self, key, path, first_frame, last_frame):
+        self.key = key
+        self.path = path
+        self.first_frame = first_frame
+        self.last_frame = last_frame
+        self.frames = FrameSet()
+        self.started = time.time()
+        self.last_change = self.started
+
+        # listing of the directory done once the render ended
+        self.scan = None
+
+    def total(self):
+        return self.last_frame - self.first_frame + 1
+
+    def done(self):
+        return len(self.frames)
+
+    def is_complete(self):
+        return self.done() == self.total()
+
+    def fps(self):
+        elapsed = self.last_change - self.started
+        return self.done() / elapsed if elapsed > 0 else 0.0
+
+    def status(self):
+        return '%s / %s (%.1f fps)' % (self.done(), self.total(), self.fps())
+
+class RenderMonitor(QtCore.QObject):
+    """
+    Follows the versions being written. Instead of listing their directory
+    the frames expected next are checked, from the first one missing on,
+    until one isn't there yet. A version stops being followed when its
+    last frame is written or when no frame was written for stall_timeout
+    seconds.
+    """
+    progress = QtCore.Signal(object)
+    finished = QtCore.Signal(object)
+
+    def __init__(self, parent, interval=500, stall_timeout=120, max_checks=100):
+        super(RenderMonitor, self).__init__(parent)
+        self._stall_timeout = stall_timeout
+        self._max_checks = max_checks
+
+        # renders being followed, by item key
+        self._renders = {}
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._poll)
+
+    ###################################################################################################
+    # Private methods
+
+    def _check(self, render):
+        # frames are mostly written in order, so the frames after the ones
+        # found last time are checked first
+        found = False
+        frame = render.frames.next_missing(render.first_frame)
+        for check in range(self._max_checks):
+            if frame > render.last_frame or not os.path.exists(render.path.replace('$F4', '%04d' % frame)):
+                break
+
+            render.frames.add(frame)
+            frame = render.frames.next_missing(frame)
+            found = True
+        return found
+
+    def _poll(self):
+        now = time.time()
+        for key, render in list(self._renders.items()):
+            if self._check(render):
+                render.last_change = now
+                self.progress.emit(render)
+
+            if render.is_complete() or now - render.last_change > self._stall_timeout:
+                self.unwatch(key)
+                self.finished.emit(render)
+
+    ###################################################################################################
+    # Public methods
+
+    def watch(self, key, path, first_frame, last_frame):
+        """
+        Follows the frames of a version, path is its abstract path using $F4.
+        """
+        self._renders[key] = RenderProgress(key, path, first_frame, last_frame)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def complete(self, key):
+        """
+        Stops following a version whose render ended, for example when a
+        blocking flipbook returned. Its directory is listed once instead of
+        checking the frames left in batches.
+        """
+        render = self._renders.get(key)
+        if not render:
+            return
+
+        render.last_change = time.time()
+        render.scan = scanner.scan_sequence(render.path)
+        for frame in render.scan.frames:
+            if render.first_frame <= frame <= render.last_frame:
+                render.frames.add(frame)
+
+        self.unwatch(key)
+        self.finished.emit(render)
+
+    def unwatch(self, key):
+        self._renders.pop(key, None)
+        if not self._renders:
+            self._timer.stop()
+
+    def get_renders(self):
+        return list(self._renders.values())
+
+    def is_watching_dir(self, dir_path):
+        dir_path = os.path.normpath(dir_path)
+        return any(os.path.normpath(os.path.dirname(render.path)) == dir_path for render in self._renders.values())
+
+    def stop(self):
+        self._renders = {}
+        self._timer.stop()
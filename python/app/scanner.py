@@ -0,0 +1,265 @@
+import os
+import re
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# splits a frame file name into head, frame number and extension
+FRAME_RE = re.compile(r'^(.*?)(\d+)(\.[^.]+)$')
+
+INVALID_RANGE = 'Invalid Sequence Object!'
+
+class ScanVersion():
+    """
+    Result of scanning the directory of one flipbook version.
+
+    frames holds the sorted frame numbers found on disk, it is None for
+    versions restored from the scan cache whose directory didn't change.
+    size is the number of bytes of the frames, None when unknown.
+    """
+    def __init__(self, path, fields, dir_mtime, frames=None, first_frame=None, last_frame=None, missing=None, thumb_source=None, size=None):
+        self.path = path
+        self.fields = fields
+        self.dir_path = os.path.dirname(path)
+        self.dir_mtime = dir_mtime
+        self.frames = frames
+        self.first_frame = first_frame
+        self.last_frame = last_frame
+        self.missing = missing or []
+        self.thumb_source = thumb_source
+        self.size = size
+
+    @classmethod
+    def from_frames(cls, path, fields, dir_mtime, frame_files, size=None):
+        frames = sorted(frame_files)
+        if not frames:
+            return cls(path, fields, dir_mtime, frames, size=size)
+
+        first_frame = frames[0]
+        last_frame = frames[-1]
+
+        missing = []
+        if len(frames) != last_frame - first_frame + 1:
+            present = set(frames)
+            missing = [frame for frame in range(first_frame, last_frame + 1) if frame not in present]
+
+        thumb_source = os.path.join(os.path.dirname(path), frame_files[frames[int(len(frames) / 2)]])
+        return cls(path, fields, dir_mtime, frames, first_frame, last_frame, missing, thumb_source, size)
+
+    @classmethod
+    def from_cache(cls, fields, data):
+        scan = data['scan']
+        return cls(scan['path'], fields, scan['dir_mtime'], None, data.get('first_frame'), data.get('last_frame'),
+                   scan.get('missing'), scan.get('thumb_source'), data.get('size'))
+
+    def is_valid(self):
+        return self.first_frame is not None
+
+    def frame_count(self):
+        if self.frames is not None:
+            return len(self.frames)
+        if not self.is_valid():
+            return 0
+        return self.last_frame - self.first_frame + 1 - len(self.missing)
+
+    def range_string(self):
+        if not self.is_valid():
+            return INVALID_RANGE
+
+        if self.missing:
+            return '[%s-%s], missing %s' % (self.first_frame, self.last_frame, format_frames(self.missing))
+        if self.first_frame == self.last_frame:
+            return str(self.first_frame)
+        return '%s-%s' % (self.first_frame, self.last_frame)
+
+    def apply(self, data):
+        # store the result in the metadata of the version, which also makes
+        # it the scan cache of the next scan
+        if self.is_valid():
+            data['first_frame'] = self.first_frame
+            data['last_frame'] = self.last_frame
+
+        data['range'] = self.range_string()
+        data['frame_count'] = self.frame_count()
+        data['size'] = self.size
+        data['scan'] = {
+            'path': self.path,
+            'dir_mtime': self.dir_mtime,
+            'missing': self.missing,
+            'thumb_source': self.thumb_source
+            }
+
+def format_frames(frames):
+    # compress a sorted frame list into ranges, [1, 2, 3, 5] -> '1-3, 5'
+    runs = []
+    for frame in frames:
+        if runs and frame == runs[-1][1] + 1:
+            runs[-1][1] = frame
+        else:
+            runs.append([frame, frame])
+
+    return ', '.join(str(start) if start == end else '%s-%s' % (start, end) for start, end in runs)
+
+def frame_paths(path, first_frame, last_frame, missing=None):
+    """
+    Returns the paths of the frames of a version from its abstract path
+    using $F4, without the missing frames.
+    """
+    if first_frame is None or last_frame is None:
+        return []
+
+    missing = set(missing or [])
+    return [path.replace('$F4', '%04d' % frame) for frame in range(first_frame, last_frame + 1) if frame not in missing]
+
+def _list_dir(dir_path):
+    # yields (name, is_dir, entry) for every entry of a directory
+    if scandir:
+        for entry in scandir(dir_path):
+            yield entry.name, entry.is_dir(), entry
+    else:
+        for name in os.listdir(dir_path):
+            yield name, os.path.isdir(os.path.join(dir_path, name)), None
+
+def _dir_mtime(dir_path, entry=None):
+    if entry is not None:
+        return entry.stat().st_mtime
+    return os.stat(dir_path).st_mtime
+
+def _file_size(dir_path, name, entry=None):
+    if entry is not None:
+        return entry.stat().st_size
+    return os.path.getsize(os.path.join(dir_path, name))
+
+def _is_padded(frame):
+    return len(frame) > 1 and frame.startswith('0')
+
+def _group_frames(dir_path, count_sizes=False):
+    # group the files of a directory by sequence, {(head, padding, tail): {frame: name}},
+    # along with the bytes of every sequence, {(head, padding, tail): size}, which
+    # takes a stat per frame and is left empty unless count_sizes is set
+    files = []
+    paddings = {}
+    shortest = {}
+    for name, is_dir, entry in _list_dir(dir_path):
+        if is_dir:
+            continue
+
+        match = FRAME_RE.match(name)
+        if match:
+            head, frame, tail = match.groups()
+            files.append((head, frame, tail, name, _file_size(dir_path, name, entry) if count_sizes else 0))
+
+            # zero padded numbers give the padding of their sequence, the
+            # shortest of the other numbers gives one if none is shorter
+            lengths = paddings.setdefault((head, tail), set())
+            if _is_padded(frame):
+                lengths.add(len(frame))
+            else:
+                shortest[(head, tail)] = min(len(frame), shortest.get((head, tail), len(frame)))
+
+    for sequence, length in iter(shortest.items()):
+        if not [padding for padding in paddings[sequence] if padding <= length]:
+            paddings[sequence].add(length)
+
+    groups = {}
+    sizes = {}
+    for head, frame, tail, name, size in files:
+        if _is_padded(frame):
+            padding = len(frame)
+        else:
+            # numbers longer than the padding overflow it, 9999 and 10000
+            # are both frames of $F4
+            padding = max(length for length in paddings[(head, tail)] if length <= len(frame))
+
+        key = (head, padding, tail)
+        groups.setdefault(key, {})[int(frame)] = name
+        if count_sizes:
+            sizes[key] = sizes.get(key, 0) + size
+    return groups, sizes
+
+def scan_sequence(path, dir_mtime=None, fields=None, count_sizes=False):
+    """
+    Lists the directory of a single flipbook version, path is the abstract
+    path of its frames using $F4. The size of the version is only counted
+    with count_sizes.
+    """
+    dir_path = os.path.dirname(path)
+    head, tail = os.path.basename(path).split('$F4')
+
+    try:
+        if dir_mtime is None:
+            dir_mtime = _dir_mtime(dir_path)
+        groups, sizes = _group_frames(dir_path, count_sizes)
+    except OSError:
+        groups, sizes = {}, {}
+
+    key = (head, 4, tail)
+    return ScanVersion.from_frames(path, fields, dir_mtime, groups.get(key, {}), sizes.get(key, 0 if count_sizes else None))
+
+def list_version_dirs(root_path):
+    """
+    Returns (dir_path, entry) for every version directory of the flipbook
+    root, version directories are expected to be direct children of it.
+    """
+    try:
+        root_entries = list(_list_dir(root_path))
+    except OSError:
+        return []
+
+    # skip files and dot directories, the app keeps its thumbnails, backups
+    # and trash in dot directories of the root so they're never versions
+    version_dirs = [(os.path.join(root_path, name), entry) for name, is_dir, entry in root_entries
+                    if is_dir and not name.startswith('.')]
+    version_dirs.sort(key=lambda version_dir: version_dir[0])
+    return version_dirs
+
+def scan_version_dir(dir_path, parse_path, cache=None, entry=None, count_sizes=False):
+    """
+    Returns a ScanVersion per flipbook sequence found in a version directory.
+
+    parse_path is called with the abstract path of every sequence found and
+    returns its template fields, or None if it isn't a flipbook of the
+    current file. cache maps version directories to the ScanVersion of an
+    earlier scan, a directory whose mtime didn't change isn't listed again.
+    The sizes of the versions are only counted with count_sizes, as that
+    takes a stat per frame.
+    """
+    try:
+        dir_mtime = _dir_mtime(dir_path, entry)
+    except OSError:
+        return []
+
+    # scans cached without a size are done again when sizes are counted
+    cached = (cache or {}).get(dir_path)
+    if cached and cached.dir_mtime == dir_mtime and (cached.size is not None or not count_sizes):
+        return [cached]
+
+    try:
+        groups, sizes = _group_frames(dir_path, count_sizes)
+    except OSError:
+        return []
+
+    versions = []
+    for (head, padding, tail), frame_files in iter(groups.items()):
+        path = os.path.join(dir_path, '%s$F%s%s' % (head, padding, tail))
+        fields = parse_path(path)
+        if fields:
+            versions.append(ScanVersion.from_frames(path, fields, dir_mtime, frame_files, sizes.get((head, padding, tail))))
+    return versions
+
+def scan_flipbooks(root_path, parse_path, cache=None, count_sizes=False):
+    """
+    Walks the flipbook root once and returns a ScanVersion per version
+    found, sorted by path.
+    """
+    versions = []
+    for dir_path, entry in list_version_dirs(root_path):
+        versions.extend(scan_version_dir(dir_path, parse_path, cache, entry, count_sizes))
+
+    versions.sort(key=lambda version: version.path)
+    return versions
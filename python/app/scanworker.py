@@ -0,0 +1,64 @@
+from sgtk.platform.qt import QtCore
+
+import time
+
+from . import perf, scanner
+
+# a batch is sent to the panel once it holds this many directories or
+# this many seconds went by since the last one
+BATCH_SIZE = 25
+BATCH_INTERVAL = 0.1
+
+class ScanWorker(QtCore.QThread):
+    """
+    Scans the flipbook root on a background thread and streams the
+    versions found back to the panel in batches. Every signal carries the
+    generation of the refresh that started the worker so the panel can
+    drop the results of a refresh that was superseded.
+    """
+    batch_ready = QtCore.Signal(int, object)
+    progress = QtCore.Signal(int, int, int)
+    scan_done = QtCore.Signal(int, bool, object)
+
+    def __init__(self, generation, root_path, parse_path, cache, parent=None):
+        super(ScanWorker, self).__init__(parent)
+        self._generation = generation
+        self._root_path = root_path
+        self._parse_path = parse_path
+        self._cache = cache
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        with perf.span('scan', generation=self._generation) as attrs:
+            self._scan(attrs)
+
+    def _scan(self, attrs):
+        version_dirs = scanner.list_version_dirs(self._root_path)
+        total = len(version_dirs)
+        attrs['dirs'] = total
+
+        # the last versions come first so the recent flipbooks show up
+        # before the old ones
+        batch = []
+        last_emit = time.time()
+        for index, (dir_path, entry) in enumerate(reversed(version_dirs)):
+            if self._cancelled:
+                break
+
+            # the sizes are only counted here, off the UI thread
+            batch.extend(scanner.scan_version_dir(dir_path, self._parse_path, self._cache, entry, count_sizes=True))
+
+            if batch and (len(batch) >= BATCH_SIZE or time.time() - last_emit > BATCH_INTERVAL):
+                self.batch_ready.emit(self._generation, batch)
+                self.progress.emit(self._generation, index + 1, total)
+                batch = []
+                last_emit = time.time()
+
+        if batch and not self._cancelled:
+            self.batch_ready.emit(self._generation, batch)
+
+        self.progress.emit(self._generation, total, total)
+        self.scan_done.emit(self._generation, not self._cancelled, [dir_path for dir_path, entry in version_dirs])
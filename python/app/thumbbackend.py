@@ -0,0 +1,147 @@
+from sgtk.platform.qt import QtCore, QtGui
+
+import os
+import functools
+
+THUMBNAIL_WIDTH = 80
+
+class ThumbnailBackend():
+    """
+    Interface of the thumbnail generators used by the scheduler.
+
+    start() begins writing the thumbnail of a job to job.thumb_path and
+    returns a handle with a cancel() method. The backend calls
+    finished(job, success) on the main thread once it is done.
+    """
+    def can_handle(self, source_path):
+        raise NotImplementedError
+
+    def start(self, job, parent, finished):
+        raise NotImplementedError
+
+class QtImageBackend(ThumbnailBackend):
+    """
+    Decodes the frame in-process at thumbnail size on a thread pool, which
+    lets the jpeg decoder skip most of the work through DCT scaling.
+    """
+    def __init__(self, max_threads=4):
+        self._pool = QtCore.QThreadPool()
+        self._pool.setMaxThreadCount(max(1, max_threads))
+        self._formats = set()
+
+        for image_format in QtGui.QImageReader.supportedImageFormats():
+            self._formats.add(bytes(image_format).decode('ascii').lower())
+
+    def can_handle(self, source_path):
+        extension = os.path.splitext(source_path)[1][1:].lower()
+        return extension in self._formats
+
+    def start(self, job, parent, finished):
+        task = _DecodeTask(job, functools.partial(finished, job))
+        self._pool.start(task)
+        return task
+
+class FFmpegBackend(ThumbnailBackend):
+    """
+    Starts an ffmpeg process per thumbnail, used for every format Qt can't
+    read such as exr.
+    """
+    def __init__(self, ffmpeg_exec):
+        self._ffmpeg_exec = ffmpeg_exec
+
+    def can_handle(self, source_path):
+        return True
+
+    def start(self, job, parent, finished):
+        # the scheduler only expects finished() once start() returned
+        ffmpeg_exec = self._ffmpeg_exec()
+        if not ffmpeg_exec:
+            QtCore.QTimer.singleShot(0, functools.partial(finished, job, False))
+            return _ProcessHandle(None)
+
+        process = QtCore.QProcess(parent)
+        process.finished.connect(functools.partial(self._process_finished, job, process, finished))
+
+        # a process that fails to start never emits finished, older
+        # bindings only have the error signal
+        error_signal = getattr(process, 'errorOccurred', None) or process.error
+        error_signal.connect(functools.partial(self._process_error, job, process, finished))
+
+        arguments = '-i %s -y -vf scale=%s:-1 %s' % (job.source_path, THUMBNAIL_WIDTH, job.thumb_path)
+        process.start(ffmpeg_exec, arguments.split(' '))
+        return _ProcessHandle(process)
+
+    def _process_finished(self, job, process, finished, *args):
+        process.deleteLater()
+        success = process.exitStatus() == QtCore.QProcess.NormalExit and process.exitCode() == 0
+        finished(job, success)
+
+    def _process_error(self, job, process, finished, error):
+        if error == QtCore.QProcess.FailedToStart:
+            process.deleteLater()
+            QtCore.QTimer.singleShot(0, functools.partial(finished, job, False))
+
+class _ProcessHandle():
+    def __init__(self, process):
+        self._process = process
+
+    def cancel(self):
+        if self._process is None:
+            return
+
+        try:
+            self._process.kill()
+        except RuntimeError:
+            # the process already went away
+            pass
+
+class _DecodeSignals(QtCore.QObject):
+    finished = QtCore.Signal(bool)
+
+    def __init__(self, callback):
+        super(_DecodeSignals, self).__init__()
+        self._callback = callback
+        self._cancelled = False
+
+        # the signals object lives on the main thread, so the callback runs there
+        self.finished.connect(self._on_finished)
+
+    def _on_finished(self, success):
+        if not self._cancelled:
+            self._callback(success)
+
+class _DecodeTask(QtCore.QRunnable):
+    def __init__(self, job, callback):
+        super(_DecodeTask, self).__init__()
+        self._job = job
+        self._signals = _DecodeSignals(callback)
+
+    def cancel(self):
+        self._signals._cancelled = True
+
+    def run(self):
+        success = False
+        try:
+            if not self._signals._cancelled:
+                success = decode_thumbnail(self._job.source_path, self._job.thumb_path)
+        finally:
+            self._signals.finished.emit(success)
+
+def decode_thumbnail(source_path, thumb_path, width=THUMBNAIL_WIDTH):
+    reader = QtGui.QImageReader(source_path)
+    if not reader.canRead():
+        return False
+
+    # let the decoder produce the reduced size directly
+    size = reader.size()
+    if size.isValid() and size.width() > width:
+        reader.setScaledSize(QtCore.QSize(width, max(1, int(size.height() * width / float(size.width())))))
+
+    image = reader.read()
+    if image.isNull():
+        return False
+
+    if image.width() > width:
+        image = image.scaledToWidth(width, QtCore.Qt.SmoothTransformation)
+
+    return image.save(thumb_path, 'JPG')
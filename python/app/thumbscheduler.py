@@ -0,0 +1,131 @@
+from sgtk.platform.qt import QtCore
+
+import time
+import heapq
+import itertools
+
+from . import perf
+
+class ThumbnailJob():
+    def __init__(self, key, source_path, thumb_path, callback):
+        self.key = key
+        self.source_path = source_path
+        self.thumb_path = thumb_path
+        self.callback = callback
+
+        # index of the backend currently generating the thumbnail and
+        # when it started
+        self.backend_index = -1
+        self.started = None
+
+class ThumbnailScheduler(QtCore.QObject):
+    """
+    Runs the thumbnail generation of the panel with at most max_jobs jobs
+    at a time. Jobs are keyed so a version is never queued twice, and jobs
+    of visible rows are started before the others.
+
+    Each job is handed to the first backend that can handle its source
+    frame, the next backend is tried when one fails.
+    """
+    (VISIBLE, NORMAL) = range(2)
+
+    def __init__(self, panel, backends, max_jobs=4):
+        super(ThumbnailScheduler, self).__init__(panel)
+        self._panel = panel
+        self._backends = backends
+        self._max_jobs = max(1, max_jobs)
+
+        # heap of (priority, order, key) entries, entries whose priority
+        # doesn't match the one of the pending job are stale
+        self._queue = []
+        self._order = itertools.count()
+        self._pending = {}
+        self._priorities = {}
+        self._running = {}
+
+    ###################################################################################################
+    # Private methods
+
+    def _push(self, key, priority):
+        self._priorities[key] = priority
+        heapq.heappush(self._queue, (priority, next(self._order), key))
+
+    def _pop(self):
+        while self._queue:
+            priority, order, key = heapq.heappop(self._queue)
+            if key in self._pending and self._priorities[key] == priority:
+                self._priorities.pop(key)
+                return self._pending.pop(key)
+        return None
+
+    def _start_jobs(self):
+        while len(self._running) < self._max_jobs:
+            job = self._pop()
+            if not job:
+                break
+
+            if not self._start_backend(job):
+                job.callback()
+
+    def _start_backend(self, job):
+        for index in range(job.backend_index + 1, len(self._backends)):
+            backend = self._backends[index]
+            if backend.can_handle(job.source_path):
+                job.backend_index = index
+                job.started = time.time()
+                self._running[job.key] = (job, backend.start(job, self, self._job_finished))
+                return True
+        return False
+
+    def _job_finished(self, job, success):
+        # ignore jobs that were cancelled
+        running = self._running.get(job.key)
+        if not running or running[0] is not job:
+            return
+
+        self._running.pop(job.key)
+        perf.record('thumbnail', job.started, time.time() - job.started, version=job.key,
+                    backend=type(self._backends[job.backend_index]).__name__, success=success)
+
+        if success or not self._start_backend(job):
+            job.callback()
+
+        self._start_jobs()
+
+    ###################################################################################################
+    # Public methods
+
+    def request(self, job, priority=NORMAL):
+        if job.key in self._running:
+            return
+
+        # only raise the priority of a job that is already queued
+        if job.key in self._pending:
+            if priority < self._priorities[job.key]:
+                self._push(job.key, priority)
+            return
+
+        self._pending[job.key] = job
+        self._push(job.key, priority)
+        self._start_jobs()
+
+    def prioritize(self, keys):
+        for key in keys:
+            if key in self._pending and self._priorities[key] != self.VISIBLE:
+                self._push(key, self.VISIBLE)
+
+    def cancel(self, keys):
+        for key in keys:
+            # stale heap entries are skipped when popping
+            self._pending.pop(key, None)
+            self._priorities.pop(key, None)
+
+            running = self._running.pop(key, None)
+            if running:
+                running[1].cancel()
+
+        self._start_jobs()
+
+    def cancel_all(self):
+        self.cancel(list(self._pending.keys()) + list(self._running.keys()))
+        self._queue = []
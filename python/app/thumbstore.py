@@ -0,0 +1,63 @@
+import os
+import base64
+
+from .fsutils import make_dirs, replace_file
+
+class ThumbnailStore():
+    """
+    Keeps one jpg per flipbook version in '<root>/.<name>_thumbs', named
+    after the json name of the version. The metadata only references the
+    file name, so loading it doesn't depend on the size of the thumbnails.
+    """
+    def __init__(self, root_path, name):
+        self._dir = os.path.join(root_path, '.{}_thumbs'.format(name))
+
+    def file_name(self, key):
+        return '{}.jpg'.format(key)
+
+    def path(self, key):
+        return os.path.join(self._dir, self.file_name(key))
+
+    def temp_path(self, key):
+        # the extension tells ffmpeg which format to write
+        return os.path.join(self._dir, 'tmp_{}.jpg'.format(key))
+
+    def make_dir(self):
+        make_dirs(self._dir)
+
+    def has(self, key):
+        return os.path.exists(self.path(key))
+
+    def add_file(self, key, src_path):
+        replace_file(src_path, self.path(key))
+        return self.file_name(key)
+
+    def write(self, key, data):
+        self.make_dir()
+        tmp_path = self.temp_path(key)
+        with open(tmp_path, 'wb') as thumb_file:
+            thumb_file.write(data)
+        return self.add_file(key, tmp_path)
+
+    def remove(self, key):
+        for path in (self.path(key), self.temp_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+def extract_inline_thumbnails(json_manager, store):
+    """
+    Moves the base64 thumbnails older versions of the app kept in the
+    metadata into the store and replaces them by a reference.
+    """
+    with json_manager.batch():
+        for item_name in json_manager.item_names():
+            data = json_manager.get_item_data(item_name)
+            if 'thumb' not in data:
+                continue
+
+            thumb = data.pop('thumb')
+            if not isinstance(thumb, bytes):
+                thumb = thumb.encode('utf-8')
+
+            data['thumb_file'] = store.write(item_name, base64.b64decode(thumb))
+            json_manager.write_item_data(item_name, data)
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+
+from .fsutils import make_dirs
+
+class Trash():
+    """
+    Deleted version directories are renamed into '<root>/.trash', which is
+    instant on the same file system, and removed by a background thread.
+
+    Every move writes a manifest with the json names of the versions first,
+    so the metadata of a delete interrupted by a crash can still be removed
+    by recover() when the panel starts again.
+    """
+    def __init__(self, root_path):
+        self._dir = os.path.join(root_path, '.trash')
+        self._purger = None
+        self._lock = threading.Lock()
+
+    ###################################################################################################
+    # Private methods
+
+    def _manifest_path(self, entry_path):
+        return entry_path + '.json'
+
+    def _entries(self):
+        if not os.path.isdir(self._dir):
+            return []
+        return [os.path.join(self._dir, name) for name in os.listdir(self._dir)
+                if os.path.isdir(os.path.join(self._dir, name))]
+
+    def _purge(self):
+        while True:
+            with self._lock:
+                entries = self._entries()
+                if not entries:
+                    self._purger = None
+                    return
+
+            for entry_path in entries:
+                shutil.rmtree(entry_path, ignore_errors=True)
+                if os.path.exists(entry_path):
+                    # still in use, try again on the next purge
+                    with self._lock:
+                        self._purger = None
+                    return
+
+                manifest_path = self._manifest_path(entry_path)
+                if os.path.exists(manifest_path):
+                    os.remove(manifest_path)
+
+    ###################################################################################################
+    # Public methods
+
+    def move(self, dir_path, names):
+        """
+        Moves a version directory into the trash, names are the json names
+        of the versions it holds.
+        """
+        make_dirs(self._dir)
+
+        entry_name = '{}_{}_{}'.format(os.path.basename(dir_path), int(time.time()), uuid.uuid4().hex[:8])
+        entry_path = os.path.join(self._dir, entry_name)
+
+        with open(self._manifest_path(entry_path), 'w') as manifest:
+            json.dump({'path': dir_path, 'names': names}, manifest)
+
+        try:
+            os.rename(dir_path, entry_path)
+        except OSError:
+            os.remove(self._manifest_path(entry_path))
+            raise
+
+    def purge(self):
+        """
+        Removes the directories in the trash on a background thread.
+        """
+        with self._lock:
+            if self._purger:
+                return
+
+            self._purger = threading.Thread(target=self._purge)
+            self._purger.daemon = True
+            self._purger.start()
+
+    def recover(self):
+        """
+        Returns the json names of the versions of deletes that were
+        interrupted, and forgets the deletes that never moved their
+        directory.
+        """
+        if not os.path.isdir(self._dir):
+            return []
+
+        names = []
+        for file_name in os.listdir(self._dir):
+            if not file_name.endswith('.json'):
+                continue
+
+            manifest_path = os.path.join(self._dir, file_name)
+            try:
+                with open(manifest_path, 'r') as manifest:
+                    data = json.load(manifest)
+            except ValueError:
+                data = {'path': None, 'names': []}
+
+            entry_path = manifest_path[:-len('.json')]
+            if not os.path.exists(entry_path) and (not data['path'] or os.path.exists(data['path'])):
+                os.remove(manifest_path)
+                continue
+
+            names.extend(data['names'])
+            if not os.path.exists(entry_path):
+                os.remove(manifest_path)
+        return names
@@ -1,125 +1,89 @@
-from sgtk.platform.qt import QtCore, QtGui
-
 import os
-import shutil
-import sys
+import time
 
-import pyseq
+from . import perf, scanner, thumbscheduler
 
-class TreeItem(QtGui.QTreeWidgetItem):
-    def __init__(self, column_names, path, fields, panel):
-        super(TreeItem, self).__init__()
-        self._column_names = column_names
+class TreeItem():
+    """
+    A flipbook version shown as a row of the flipbook model. The panel is
+    told through item_changed() whenever the data of the row changes.
+    """
+    def __init__(self, path, fields, panel, scan=None):
         self._path = path
         self._fields = fields
-        self._sequence = None
+        self._thumb_source = None
+        self._thumb_failed = False
+        self._scan = scan
+        self._publish_status = None
+        self._publish_error = None
+        self._render_status = None
 
-        dir_path = os.path.dirname(os.path.dirname(self._path))
-        thumb_name = '%s.jpg' % os.path.basename(self._path).split('.')[0]
-        self._thumb_path = os.path.join(dir_path, 'tmp_{}'.format(thumb_name))
         self._panel = panel
+        self._thumb_store = panel.get_thumbnail_store()
+        self._thumb_path = self._thumb_store.temp_path(self._fields['json_name'])
 
-        # set version
-        self.setText(self._column_names.index_name('name'), 'v%s' % (str(self._fields['version']).zfill(3)))
-
-        # set comment
-        if 'comment' in self._fields['data'].keys():
-            self.setText(self._column_names.index_name('comment'), self._fields['data']['comment'])
-        
         # set publish status
         self._set_published()
 
         # set range
-        if 'range' in self._fields['data'].keys():
-            self.setText(self._column_names.index_name('range'), self._fields['data']['range'])
+        if not self._scan and 'range' in self._fields['data'].keys():
+            self._thumb_source = self._fields['data'].get('scan', {}).get('thumb_source')
         else:
             self._set_range()
 
     ###################################################################################################
     # Private methods
 
-    def _create_thumbnail(self):
-        if self._sequence:
-            seq_thumb_path = self._sequence[int(self._sequence.length() / 2)].path
+    def _create_thumbnail(self, priority):
+        if self._thumb_source and not self._thumb_failed:
+            self._thumb_store.make_dir()
 
-            process = QtCore.QProcess(self._panel)
-            process.finished.connect(self._set_thumbnail)
-            arguments = '-i %s -y -vf scale=80:-1 %s' % (seq_thumb_path, self._thumb_path)
-
-            process.start(self._panel.get_ffmpeg_exec(), arguments.split(' '))
+            job = thumbscheduler.ThumbnailJob(self._fields['json_name'], self._thumb_source, self._thumb_path, self._set_thumbnail)
+            self._panel.get_thumbnail_scheduler().request(job, priority)
 
     def _set_thumbnail(self):
+        key = self._fields['json_name']
+
+        # move a freshly generated thumbnail into the store
         if os.path.exists(self._thumb_path):
-            self.treeWidget().itemWidget(self, self._column_names.index_name('thumb'))
-            if not self.treeWidget().itemWidget(self, self._column_names.index_name('thumb')):
-                image = QtGui.QPixmap(self._thumb_path)
-                self.setSizeHint(self._column_names.index_name('thumb'), image.size())
-                
-                thumbnail = QtGui.QLabel("", self.treeWidget())
-                thumbnail.setAlignment(QtCore.Qt.AlignHCenter)
-                thumbnail.setPixmap(image)
-                self.treeWidget().setItemWidget(self, self._column_names.index_name('thumb'), thumbnail)
-                
-                # add to json data
-                ba = QtCore.QByteArray()
-                buff = QtCore.QBuffer(ba)
-                buff.open(QtCore.QIODevice.WriteOnly) 
-                image.save(buff, "JPG")
-
-                if sys.version_info.major == 2:
-                    self._fields['data']['thumb'] = ba.toBase64().data()
-                elif sys.version_info.major == 3:
-                    self._fields['data']['thumb'] = ba.toBase64().data().decode('UTF-8')
-
-                # remove tmp file
-                os.remove(self._thumb_path)
-        elif 'thumb' in self._fields['data'].keys():
-                thumb_bytes = None
-                
-                if sys.version_info.major == 2:
-                    thumb_bytes = self._fields['data']['thumb'].encode("utf-8")
-                elif sys.version_info.major == 3:
-                    thumb_bytes = bytes(self._fields['data']['thumb'], 'UTF-8')
-                ba = QtCore.QByteArray.fromBase64(thumb_bytes)
-                image = QtGui.QPixmap()
-                image.loadFromData(ba, "JPG")
-                
-                thumbnail = QtGui.QLabel("", self.treeWidget())
-                thumbnail.setAlignment(QtCore.Qt.AlignHCenter)
-                thumbnail.setPixmap(image)
-                self.treeWidget().setItemWidget(self, self._column_names.index_name('thumb'), thumbnail)
+            self._fields['data']['thumb_file'] = self._thumb_store.add_file(key, self._thumb_path)
+            self._panel.write_item_data(self)
+            self._panel.item_changed(self, thumbnail=True)
         else:
+            # don't try again before the frames change
+            self._thumb_failed = True
+
             msg = "Could not find thumnail at '%s'. Failed to generate it!" % (self._thumb_path)
             self._panel._app.log_error(msg)
 
+    def _scan_from_disk(self):
+        try:
+            dir_mtime = os.stat(os.path.dirname(self._path)).st_mtime
+        except OSError:
+            dir_mtime = None
+
+        # only list the frames again when the directory changed since the last scan
+        scan = self._fields['data'].get('scan', {})
+        if dir_mtime is not None and scan.get('dir_mtime') == dir_mtime and 'path' in scan:
+            return scanner.ScanVersion.from_cache(self._fields, self._fields['data'])
+
+        return scanner.scan_sequence(self._path, dir_mtime, self._fields)
+
     def _set_range(self):
-        sequences = pyseq.get_sequences(self._path.replace('$F4', '*'))
-        cache_range = 'Invalid Sequence Object!'
-        
-        if sequences:
-            self._sequence = sequences[0]
-
-            if self._sequence.missing():
-                cache_range = '[%s-%s], missing %s' % (self._sequence.format('%s'), self._sequence.format('%e'), self._sequence.format('%m'))
-            else:
-                cache_range = self._sequence.format('%R')
-
-            self._fields['data']['first_frame'] = self._sequence.start()
-            self._fields['data']['last_frame'] = self._sequence.end()
-        
-        self._fields['data']['range'] = cache_range
-        self.setText(self._column_names.index_name('range'), cache_range)
+        # use the result of the last panel scan once, check the disk otherwise
+        with perf.span('set_range', version=self._fields['json_name'], from_disk=not self._scan):
+            scan = self._scan or self._scan_from_disk()
+        self._scan = None
+
+        if scan.thumb_source != self._thumb_source:
+            self._thumb_failed = False
+
+        scan.apply(self._fields['data'])
+        self._thumb_source = scan.thumb_source
 
     def _set_published(self):
         if 'publish' not in self._fields['data'].keys():
             self._fields['data']['publish'] = False
-        
-        if self._fields['data']['publish']:
-            image_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "resources", "check.svg"))
-        else:
-            image_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "resources", "cross.svg"))
-
-        self.setIcon(self._column_names.index_name('publish'), QtGui.QPixmap(image_path))
 
     ###################################################################################################
     # Public methods
@@ -127,28 +91,85 @@ class TreeItem(QtGui.QTreeWidgetItem):
     def refresh(self):
         self._set_published()
         self._set_range()
-        self.load_thumbnail()
+        self._panel.item_changed(self)
 
-    def load_thumbnail(self):
-        if 'thumb' in self._fields['data'].keys():
-            self._set_thumbnail()
-        else:
-            self._create_thumbnail()
+    def set_scan(self, scan):
+        self._scan = scan
 
-    def remove_cache(self):
-        shutil.rmtree(os.path.dirname(self._path))
-        if os.path.exists(self._thumb_path):
-            os.remove(self._thumb_path)
+    def update_range(self):
+        self._set_range()
+        self._panel.item_changed(self)
+
+    def load_thumbnail(self, priority=thumbscheduler.ThumbnailScheduler.NORMAL):
+        if not self._thumb_store.has(self._fields['json_name']):
+            self._create_thumbnail(priority)
+
+    def get_thumbnail_path(self):
+        if 'thumb_file' in self._fields['data'].keys():
+            return self._thumb_store.path(self._fields['json_name'])
+        return None
 
     def set_comment(self, comment):
         self._fields['data']['comment'] = comment
-        self.setText(self._column_names.index_name('comment'), comment)
+        self._panel.item_changed(self)
+
+    def get_label(self):
+        return 'v%s' % (str(self._fields['version']).zfill(3))
+
+    def get_range(self):
+        # show the progress of a version being written instead
+        if self._render_status:
+            return self._render_status
+        return self._fields['data'].get('range', '')
+
+    def get_size(self):
+        # a scan not applied yet is more recent than the metadata
+        if self._scan and self._scan.size is not None:
+            return self._scan.size
+        return self._fields['data'].get('size')
+
+    def get_frame_count(self):
+        return self._fields['data'].get('frame_count', 0)
+
+    def get_last_viewed(self):
+        return self._fields['data'].get('last_viewed')
+
+    def viewed(self):
+        self._fields['data']['last_viewed'] = time.time()
+
+    def get_comment(self):
+        return self._fields['data'].get('comment', '')
+
+    def is_published(self):
+        return self._fields['data']['publish']
 
     def get_fields(self):
         return self._fields
 
+    def get_key(self):
+        return self._fields['json_name']
+
     def get_path(self):
         return self._path
 
+    def get_frame_paths(self):
+        data = self._fields['data']
+        return scanner.frame_paths(self._path, data.get('first_frame'), data.get('last_frame'), data.get('scan', {}).get('missing'))
+
+    def set_render_status(self, status):
+        self._render_status = status
+        self._panel.item_changed(self)
+
+    def set_publish_status(self, status, error=None):
+        self._publish_status = status
+        self._publish_error = error
+        self._panel.item_changed(self)
+
+    def get_publish_status(self):
+        return self._publish_status
+
+    def get_publish_error(self):
+        return self._publish_error
+
     def published(self):
-        self._fields['data']['publish'] = True
\ No newline at end of file
+        self._fields['data']['publish'] = True
@@ -0,0 +1,156 @@
+import os
+import time
+import mimetypes
+import threading
+
+try:
+    from urllib.parse import urlunparse
+except ImportError:
+    from urlparse import urlunparse
+
+# size of the parts of a chunked upload, cloud storage needs at least 5MB
+CHUNK_SIZE = 20 * 1024 * 1024
+
+# attempts of every part and the delay before the first retry, doubled
+# after every failed attempt
+PART_ATTEMPTS = 5
+PART_RETRY_DELAY = 1.0
+
+class UploadCancelled(Exception):
+    pass
+
+class UploadState():
+    """
+    Parts of a chunked upload sent so far, kept between the attempts of
+    an upload so a failed one resumes after the last part sent.
+    """
+    def __init__(self, size, mtime, chunk_size, upload_info):
+        self.size = size
+        self.mtime = mtime
+        self.chunk_size = chunk_size
+        self.upload_info = upload_info
+        self.etags = []
+        self.completed = False
+
+    def matches(self, size, mtime, chunk_size):
+        return (self.size, self.mtime, self.chunk_size) == (size, mtime, chunk_size)
+
+    def sent(self):
+        return min(self.size, len(self.etags) * self.chunk_size)
+
+class ChunkedUploader():
+    """
+    Uploads files to an entity field in parts when the site stores its
+    uploads in cloud storage. Every part is retried on its own and the
+    parts already sent are kept, so a dropped connection doesn't restart
+    the upload from the beginning.
+
+    shotgun_api3 only uploads in parts through private methods. When the
+    connection doesn't have them, the site doesn't upload to cloud storage
+    or the file fits in one part, shotgun.upload() is used instead.
+    """
+    REQUIRED_METHODS = ('_get_attachment_upload_info', '_get_upload_part_link', '_upload_data_to_storage',
+                        '_complete_multipart_upload', '_send_form', '_auth_params')
+
+    def __init__(self, chunk_size=CHUNK_SIZE, attempts=PART_ATTEMPTS, retry_delay=PART_RETRY_DELAY):
+        self._chunk_size = chunk_size
+        self._attempts = attempts
+        self._retry_delay = retry_delay
+
+        # upload states by (entity type, entity id, path)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    ###################################################################################################
+    # Private methods
+
+    def _supports_chunks(self, shotgun):
+        if not all(hasattr(shotgun, name) for name in ChunkedUploader.REQUIRED_METHODS):
+            return False
+        return bool(getattr(shotgun, 'server_info', {}).get('s3_direct_uploads_enabled'))
+
+    def _get_state(self, shotgun, key, path, size, mtime):
+        with self._lock:
+            state = self._states.get(key)
+
+        if not state or not state.matches(size, mtime, self._chunk_size):
+            upload_info = shotgun._get_attachment_upload_info(False, os.path.basename(path), True)
+            state = UploadState(size, mtime, self._chunk_size, upload_info)
+            with self._lock:
+                self._states[key] = state
+        return state
+
+    def _send_part(self, shotgun, state, filename, part_number, data, content_type, cancelled):
+        delay = self._retry_delay
+        for attempt in range(self._attempts):
+            if cancelled and cancelled():
+                raise UploadCancelled()
+
+            try:
+                # part links expire, get a new one for every attempt
+                part_url = shotgun._get_upload_part_link(state.upload_info, filename, part_number)
+                return shotgun._upload_data_to_storage(data, content_type, len(data), part_url)
+            except Exception:
+                if attempt == self._attempts - 1:
+                    raise
+
+            time.sleep(delay)
+            delay *= 2
+
+    def _link_file(self, shotgun, entity_type, entity_id, field_name, filename, upload_info):
+        # attach the uploaded file to the entity, as shotgun_api3 does
+        # after uploading to cloud storage
+        url = urlunparse((shotgun.config.scheme, shotgun.config.server, "/upload/api_link_file", None, None, None))
+        params = {
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "upload_link_info": upload_info["upload_info"],
+            "field_name": field_name,
+            "display_name": filename
+            }
+        params.update(shotgun._auth_params())
+
+        result = shotgun._send_form(url, params)
+        if not str(result).startswith("1"):
+            raise Exception("Could not link the uploaded file %s: %s" % (filename, result))
+        return int(str(result).split(":", 2)[1].split("\n", 1)[0])
+
+    ###################################################################################################
+    # Public methods
+
+    def upload(self, shotgun, entity_type, entity_id, path, field_name, progress=None, cancelled=None):
+        """
+        Uploads path to the field of an entity and returns the id of the
+        attachment. progress is called with the bytes sent and the size of
+        the file after every part, cancelled is polled between parts.
+        """
+        size = os.path.getsize(path)
+        if size <= self._chunk_size or not self._supports_chunks(shotgun):
+            attachment_id = shotgun.upload(entity_type, entity_id, path, field_name)
+            if progress:
+                progress(size, size)
+            return attachment_id
+
+        key = (entity_type, entity_id, path)
+        state = self._get_state(shotgun, key, path, size, os.path.getmtime(path))
+
+        filename = os.path.basename(path)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        with open(path, 'rb') as upload_file:
+            upload_file.seek(len(state.etags) * state.chunk_size)
+            while state.sent() < size:
+                data = upload_file.read(state.chunk_size)
+                etag = self._send_part(shotgun, state, filename, len(state.etags) + 1, data, content_type, cancelled)
+                state.etags.append(etag)
+
+                if progress:
+                    progress(state.sent(), size)
+
+        if not state.completed:
+            shotgun._complete_multipart_upload(state.upload_info, filename, state.etags)
+            state.completed = True
+        attachment_id = self._link_file(shotgun, entity_type, entity_id, field_name, filename, state.upload_info)
+
+        with self._lock:
+            self._states.pop(key, None)
+        return attachment_id
@@ -0,0 +1,126 @@
+from sgtk.platform.qt import QtCore
+
+import os
+
+class FlipbookWatcher(QtCore.QObject):
+    """
+    Reports changes of the flipbook root and of the version directories.
+
+    Directories are watched with a QFileSystemWatcher, the ones it can't
+    watch are polled by comparing their mtime instead. In 'poll' mode every
+    directory is polled, which also catches changes made from other
+    machines on network storage. Changes are collected for a short while
+    so a flipbook writing many frames only triggers a single update.
+    """
+    root_changed = QtCore.Signal()
+    dirs_changed = QtCore.Signal(object)
+
+    def __init__(self, parent, mode='watch', poll_interval=2000, delay=300):
+        super(FlipbookWatcher, self).__init__(parent)
+        self._mode = mode
+        self._root_path = None
+
+        # mtime of the polled directories and the changes not reported yet
+        self._polled = {}
+        self._changed = set()
+
+        self._watcher = None
+        if mode == 'watch':
+            self._watcher = QtCore.QFileSystemWatcher(self)
+            self._watcher.directoryChanged.connect(self._dir_changed)
+
+        self._poll_timer = QtCore.QTimer(self)
+        self._poll_timer.setInterval(poll_interval)
+        self._poll_timer.timeout.connect(self._poll)
+
+        self._report_timer = QtCore.QTimer(self)
+        self._report_timer.setSingleShot(True)
+        self._report_timer.setInterval(delay)
+        self._report_timer.timeout.connect(self._report)
+
+    ###################################################################################################
+    # Private methods
+
+    def _dir_changed(self, path):
+        self._changed.add(os.path.normpath(path))
+        self._report_timer.start()
+
+    def _poll(self):
+        for path, mtime in list(self._polled.items()):
+            new_mtime = _get_mtime(path)
+            if new_mtime != mtime:
+                self._polled[path] = new_mtime
+                self._dir_changed(path)
+
+    def _report(self):
+        changed = self._changed
+        self._changed = set()
+
+        if self._root_path in changed:
+            changed.discard(self._root_path)
+            self.root_changed.emit()
+
+        if changed:
+            self.dirs_changed.emit(changed)
+
+    def _add_paths(self, paths):
+        unwatched = paths
+        if self._watcher:
+            unwatched = [path for path in paths if not self._watcher.addPath(path)]
+
+        for path in unwatched:
+            self._polled[path] = _get_mtime(path)
+
+        if self._polled and not self._poll_timer.isActive():
+            self._poll_timer.start()
+
+    def _remove_paths(self, paths):
+        for path in paths:
+            if self._polled.pop(path, False) is False and self._watcher:
+                self._watcher.removePath(path)
+
+        if not self._polled:
+            self._poll_timer.stop()
+
+    def _watched_paths(self):
+        paths = set(self._polled.keys())
+        if self._watcher:
+            paths.update(os.path.normpath(path) for path in self._watcher.directories())
+        return paths
+
+    ###################################################################################################
+    # Public methods
+
+    def set_root(self, root_path):
+        self.stop()
+        if self._mode == 'off' or not os.path.isdir(root_path):
+            return
+
+        self._root_path = os.path.normpath(root_path)
+        self._add_paths([self._root_path])
+
+    def is_watching(self):
+        return self._root_path is not None
+
+    def set_version_dirs(self, dir_paths):
+        if self._root_path is None:
+            return
+
+        dir_paths = set(os.path.normpath(path) for path in dir_paths)
+        dir_paths.add(self._root_path)
+
+        watched = self._watched_paths()
+        self._remove_paths(watched - dir_paths)
+        self._add_paths(sorted(dir_paths - watched))
+
+    def stop(self):
+        self._remove_paths(self._watched_paths())
+        self._report_timer.stop()
+        self._changed = set()
+        self._root_path = None
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None